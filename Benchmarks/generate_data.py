@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# Players and seasons at scale 1; scale 10 and 100 multiply the player counts and the season span
+BASE_MLB_PLAYERS = 500
+BASE_MILB_PLAYERS = 1500
+BASE_NPB_PLAYERS = 200
+BASE_SEASONS = 10
+FIRST_SEASON = 1871
+LAST_SEASON = 2024
+GAMES_PER_SEASON = 12 # game rows per MiLB player-season, spread over the months of the season
+
+MILB_LEVELS = [('aaa', 'AAA'), ('aa', 'AA'), ('a+', 'High-A'), ('a', 'Single-A')]
+MONTHS = [4, 5, 6, 7, 8, 9]
+NPB_TEAMS = ['Giants', 'Tigers', 'Dragons', 'Swallows', 'Carp', 'BayStars', 'Hawks', 'Lions', 'Marines', 'Buffaloes', 'Fighters', 'Eagles']
+
+SYLLABLES = ['ba', 'ke', 'ri', 'to', 'mu', 'sa', 'no', 'li', 'ra', 'de', 'jo', 'ma', 'ha', 'su', 'ki', 'ro', 'an', 'el', 'on', 'ter']
+
+def season_range(scale):
+    seasons = min(BASE_SEASONS * scale, LAST_SEASON - FIRST_SEASON + 1)
+    return LAST_SEASON - seasons + 1, LAST_SEASON
+
+def make_names(rng, count, syllables):
+    # Syllable names give a realistic share of namesakes without a name list
+    parts = rng.choice(SYLLABLES, size=(count, syllables))
+    return [''.join(p).capitalize() for p in parts]
+
+def careers(rng, count, first, last, max_length):
+    # [(start, [season, ...]), ...] with the occasional skipped season inside a career
+    starts = rng.integers(first, last + 1, size=count)
+    lengths = rng.integers(1, max_length + 1, size=count)
+    result = []
+    for start, length in zip(starts, lengths):
+        seasons = [s for s in range(start, min(start + length, last + 1)) if rng.random() > 0.15 or s == start]
+        result.append(seasons)
+    return result
+
+def generate_players(rng, scale):
+    first, last = season_range(scale)
+    total = (BASE_MLB_PLAYERS + BASE_MILB_PLAYERS + BASE_NPB_PLAYERS) * scale
+    first_names = make_names(rng, total, 2)
+    last_names = make_names(rng, total, 3)
+
+    players = pd.DataFrame({
+        'playerID': [f"syn{i:07d}" for i in range(total)],
+        'nameFirst': first_names,
+        'nameLast': last_names,
+        'kind': ['mlb'] * (BASE_MLB_PLAYERS * scale) + ['milb'] * (BASE_MILB_PLAYERS * scale) + ['npb'] * (BASE_NPB_PLAYERS * scale)
+    })
+    players['seasons'] = careers(rng, total, first, last, 12)
+    return players
+
+def mlb_appearances(rng, players, first, last):
+    # MLB players leave for whole seasons now and then; those seasons are spent in MiLB or NPB
+    rows = []
+    elsewhere = []
+    for player in players[players['kind'] == 'mlb'].itertuples(index=False):
+        seasons = player.seasons
+        mlb_seasons = set(seasons)
+        for s in range(seasons[0], seasons[-1] + 1):
+            if s not in mlb_seasons:
+                elsewhere.append((player.playerID, s, 'npb' if rng.random() < 0.1 else 'milb'))
+        for s in range(max(first, seasons[0] - 3), seasons[0]):
+            elsewhere.append((player.playerID, s, 'milb'))
+        for s in seasons:
+            rows.append((s, f"T{rng.integers(30):02d}", 'AL' if rng.random() < 0.5 else 'NL', player.playerID, int(rng.integers(1, 163))))
+    appearances = pd.DataFrame(rows, columns=['yearID', 'teamID', 'lgID', 'playerID', 'G_all'])
+    return appearances, pd.DataFrame(elsewhere, columns=['playerID', 'season', 'league'])
+
+def league_seasons(players, elsewhere, league):
+    # (playerID, season) for every season a player spends in the league
+    own = players[players['kind'] == league][['playerID', 'seasons']].explode('seasons').rename(columns={'seasons': 'season'})
+    visits = elsewhere[elsewhere['league'] == league][['playerID', 'season']]
+    return pd.concat([own, visits], ignore_index=True).astype({'season': int})
+
+def write_milb(rng, directory, players, seasons):
+    names = players.set_index('playerID')
+    seasons = seasons.assign(level=rng.integers(len(MILB_LEVELS), size=len(seasons)))
+    rows_written = 0
+    files = 0
+    for (season, level), group in seasons.groupby(['season', 'level']):
+        level_code, level_name = MILB_LEVELS[level]
+        team_ids = rng.integers(30, size=len(group))
+        frame = pd.DataFrame({
+            'game_id': 0,
+            'player_id': group['playerID'].values,
+            'player_full_name': (names.loc[group['playerID'], 'nameFirst'] + ' ' + names.loc[group['playerID'], 'nameLast']).values,
+            'league_level_name': level_name,
+            'team_name': [f"{level_name} Team {t}" for t in team_ids],
+            'team_org_name': [f"Org {t}" for t in team_ids],
+            'at_bats': 0,
+            'hits': 0
+        })
+        games = frame.loc[frame.index.repeat(GAMES_PER_SEASON)].reset_index(drop=True)
+        games['game_id'] = rng.integers(1, 10**6, size=len(games))
+        games['at_bats'] = rng.integers(0, 6, size=len(games))
+        games['hits'] = np.minimum(games['at_bats'], rng.integers(0, 4, size=len(games)))
+        months = rng.choice(MONTHS, size=len(games))
+        for month in MONTHS:
+            month_games = games[months == month]
+            if not month_games.empty:
+                month_games.to_csv(os.path.join(directory, f"{season}_{month}_{level_code}_player_game_stats.csv"), index=False)
+                rows_written += len(month_games)
+                files += 1
+    return rows_written, files
+
+def write_npb(rng, directory, players, seasons):
+    names = players.set_index('playerID')
+    rows_written = 0
+    files = 0
+    for season, group in seasons.groupby('season'):
+        ids = group['playerID'].values
+        html_names = [f'<a href="/player/{pid}">{names.at[pid, "nameLast"]}, {names.at[pid, "nameFirst"]}</a>' for pid in ids]
+        frame = pd.DataFrame({
+            'Season': season,
+            'Name': html_names,
+            'Team': rng.choice(NPB_TEAMS, size=len(ids)),
+            'G': rng.integers(1, 144, size=len(ids))
+        })
+        is_pitcher = rng.random(len(ids)) < 0.4
+        for kind, part in (('batting', frame[~is_pitcher]), ('pitching', frame[is_pitcher])):
+            part.to_csv(os.path.join(directory, f"npb_{kind}_{season}.csv"), index=False)
+            rows_written += len(part)
+            files += 1
+    return rows_written, files
+
+def generate(data_dir, scale=1, seed=0):
+    # Writes the pipeline's Data/ layout (Lahman CSVs, raw MiLB and NPB files) and returns row counts
+    rng = np.random.default_rng(seed)
+    first, last = season_range(scale)
+    for sub in ('MiLB', 'NPB'):
+        os.makedirs(os.path.join(data_dir, sub), exist_ok=True)
+
+    players = generate_players(rng, scale)
+    appearances, elsewhere = mlb_appearances(rng, players, first, last)
+    people = players[players['kind'] == 'mlb'][['playerID', 'nameFirst', 'nameLast']]
+    people.to_csv(os.path.join(data_dir, 'People.csv'), index=False)
+    appearances.to_csv(os.path.join(data_dir, 'Appearances.csv'), index=False)
+
+    milb_rows, milb_files = write_milb(rng, os.path.join(data_dir, 'MiLB'), players, league_seasons(players, elsewhere, 'milb'))
+    npb_rows, npb_files = write_npb(rng, os.path.join(data_dir, 'NPB'), players, league_seasons(players, elsewhere, 'npb'))
+
+    counts = {
+        'scale': scale,
+        'seed': seed,
+        'first_season': first,
+        'last_season': last,
+        'people_rows': len(people),
+        'appearances_rows': len(appearances),
+        'milb_rows': milb_rows,
+        'milb_files': milb_files,
+        'npb_rows': npb_rows,
+        'npb_files': npb_files
+    }
+    with open(os.path.join(data_dir, 'synthetic.json'), 'w') as f:
+        json.dump(counts, f, indent=2)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a seeded synthetic Data/ directory for benchmarking the pipeline.")
+    parser.add_argument('data_dir')
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(generate(args.data_dir, args.scale, args.seed), indent=2))
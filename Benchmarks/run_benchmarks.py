@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'Scripts')
+SQL_DIR = os.path.join(REPO_DIR, 'SQL')
+
+DEFAULT_OUTPUT = os.path.join(BENCHMARK_DIR, 'results', 'latest.json')
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, 'baseline.json')
+MIN_SECONDS_DELTA = 0.1 # timing noise on very short stages is not a regression
+
+# Stage name -> what its rows count. Each stage runs in a fresh process so its peak memory is its own.
+STAGES = {
+    'process_milb': 'raw MiLB game rows read',
+    'process_npb': 'raw NPB rows read',
+    'load': 'rows loaded into baseball_db, milb and npb',
+    'identify_per_year': 'returning player seasons found',
+    'identify_window': 'returning player seasons found',
+    'gap_details': 'returning player seasons checked',
+    'gap_details_crosswalk': 'returning player seasons checked against player_crosswalk'
+}
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    usage = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes on Linux, bytes on macOS
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def count_rows(schemas):
+    import db_config
+    from sqlalchemy import inspect, text
+    total = 0
+    for schema in schemas:
+        engine = db_config.get_engine(schema)
+        with engine.connect() as conn:
+            for table in inspect(conn).get_table_names():
+                total += conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+    return total
+
+def read_gap_details(gap_engine):
+    import db_config
+    import pandas as pd
+    engine = db_config.get_engine(gap_engine.DB_NAME)
+    return {table: pd.read_sql_table(table, engine)[['id', 'gap_details']] for table in gap_engine.list_result_tables(engine)}
+
+def run_stage(stage, counts):
+    # Runs inside the stage process, with the synthetic Data/ directory as the working directory
+    sys.path.insert(0, SCRIPTS_DIR)
+    import etl_pipeline
+    import identify_returning_players
+    import gap_engine
+
+    start_year, end_year = counts['first_season'], counts['last_season'] + 1
+    startup_rss = peak_rss_mb()
+    start = time.perf_counter()
+
+    if stage == 'process_milb':
+        etl_pipeline.process_milb_data()
+        rows = counts['milb_rows']
+    elif stage == 'process_npb':
+        etl_pipeline.process_npb_data()
+        rows = counts['npb_rows']
+    elif stage == 'load':
+        etl_pipeline.load_data_to_mysql()
+        seconds = time.perf_counter() - start
+        return seconds, count_rows(['baseball_db', 'milb', 'npb']), startup_rss
+    elif stage == 'identify_per_year':
+        identify_returning_players.run_per_year_queries(os.path.join(SQL_DIR, 'returning_players.sql'), start_year, end_year)
+        seconds = time.perf_counter() - start
+        return seconds, count_rows(['yearly_results']), startup_rss
+    elif stage == 'identify_window':
+        rows = len(identify_returning_players.run_window_query(os.path.join(SQL_DIR, 'returning_players_window.sql'), start_year, end_year))
+    elif stage == 'gap_details':
+        gap_engine.check_gaps()
+        rows = count_rows(['yearly_results'])
+    elif stage == 'gap_details_crosswalk':
+        # Also a regression check: the crosswalk join has to give the same gap_details as matching names
+        gap_engine.check_gaps(use_crosswalk=False)
+        expected = read_gap_details(gap_engine)
+        start = time.perf_counter()
+        gap_engine.update_crosswalk()
+        gap_engine.check_gaps(use_crosswalk=True)
+        seconds = time.perf_counter() - start
+        actual = read_gap_details(gap_engine)
+        differing = {table: int((expected[table].fillna('') != actual[table].fillna('')).any(axis=1).sum()) for table in expected}
+        differing = {table: n for table, n in differing.items() if n}
+        if differing:
+            raise AssertionError(f"crosswalk gap_details differ from name matching: {differing}")
+        return seconds, sum(len(df) for df in actual.values()), startup_rss
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+    return time.perf_counter() - start, rows, startup_rss
+
+def stage_main(stage, result_path):
+    with open(os.path.join('Data', 'synthetic.json')) as f:
+        counts = json.load(f)
+    seconds, rows, startup_rss = run_stage(stage, counts)
+    result = {
+        'seconds': round(seconds, 4),
+        'rows': rows,
+        'rows_per_second': round(rows / seconds, 1) if seconds > 0 else None,
+        'startup_rss_mb': startup_rss,
+        'peak_rss_mb': peak_rss_mb()
+    }
+    with open(result_path, 'w') as f:
+        json.dump(result, f)
+
+def run_scale(scale, stages, seed, keep, verbose):
+    sys.path.insert(0, BENCHMARK_DIR)
+    from generate_data import generate
+
+    work_dir = tempfile.mkdtemp(prefix=f'baseball_bench_{scale}x_')
+    print(f"\nScale {scale}x in {work_dir}")
+    try:
+        start = time.perf_counter()
+        counts = generate(os.path.join(work_dir, 'Data'), scale, seed)
+        print(f"  generate: {time.perf_counter() - start:.2f}s ({counts['milb_rows']} MiLB rows, {counts['appearances_rows']} appearances)")
+
+        # Offline: everything goes to the embedded SQLite backend inside the work directory
+        env = dict(os.environ, DB_BACKEND='sqlite', SQLITE_DIR=os.path.join('Data', 'sqlite'))
+        results = []
+        failed = []
+        for stage in stages:
+            result_path = os.path.join(work_dir, f'{stage}.json')
+            log_path = os.path.join(work_dir, f'{stage}.log')
+            with open(log_path, 'w') as log:
+                completed = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--run-stage', stage, '--result-file', result_path],
+                    cwd=work_dir, env=env, stdout=None if verbose else log, stderr=subprocess.STDOUT
+                )
+            if completed.returncode != 0:
+                print(f"  {stage}: failed, see {log_path}")
+                failed.append((scale, stage))
+                keep = True
+                continue
+
+            with open(result_path) as f:
+                result = json.load(f)
+            result.update(scale=scale, stage=stage)
+            results.append(result)
+            print(f"  {stage}: {result['seconds']:.2f}s, {result['rows']} rows, "
+                  f"{result['rows_per_second']} rows/s, peak {result['peak_rss_mb']} MB")
+        return counts, results, failed
+    finally:
+        if keep:
+            print(f"  Kept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+def compare(results, baseline, tolerance):
+    # Slower or bigger than the baseline by more than the tolerance counts as a regression
+    baseline_results = {(r['scale'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('created', 'unknown date')}:")
+    for result in results:
+        base = baseline_results.get((result['scale'], result['stage']))
+        if not base:
+            continue
+        for metric in ('seconds', 'peak_rss_mb'):
+            if not result.get(metric) or not base.get(metric):
+                continue
+            ratio = result[metric] / base[metric]
+            flag = ''
+            if ratio > 1 + tolerance and not (metric == 'seconds' and result[metric] - base[metric] < MIN_SECONDS_DELTA):
+                flag = '  REGRESSION'
+                regressions.append((result['scale'], result['stage'], metric, ratio))
+            print(f"  {result['scale']}x {result['stage']:<18} {metric:<12} {base[metric]:>10} -> {result[metric]:>10} ({ratio:.2f}x){flag}")
+    return regressions
+
+def write_json(path, data):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each pipeline stage on seeded synthetic data with the embedded SQLite backend.")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1], help="Scale factors for players and seasons, e.g. 1 10 100")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), default=list(STAGES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Where to write the results JSON")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Results JSON to compare against, if it exists")
+    parser.add_argument('--save-baseline', action='store_true', help="Also store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown or memory growth before a stage is flagged")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated data and SQLite files")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output")
+    parser.add_argument('--run-stage', choices=list(STAGES), help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_stage:
+        stage_main(args.run_stage, args.result_file)
+        return 0
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'process_workers': os.getenv('PROCESS_WORKERS'),
+        'seed': args.seed,
+        'stages': {stage: STAGES[stage] for stage in args.stages},
+        'datasets': [],
+        'results': []
+    }
+    failed = []
+    for scale in args.scales:
+        counts, results, scale_failed = run_scale(scale, args.stages, args.seed, args.keep, args.verbose)
+        report['datasets'].append(counts)
+        report['results'].extend(results)
+        failed.extend(scale_failed)
+
+    write_json(args.output, report)
+    print(f"\nResults written to {args.output}")
+    if failed:
+        print(f"{len(failed)} stage(s) failed: {', '.join(f'{stage} at {scale}x' for scale, stage in failed)}")
+        return 1
+    if args.save_baseline:
+        write_json(args.baseline, report)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(report['results'], json.load(f), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+WITH seasons AS (
+    SELECT DISTINCT playerID, yearID
+    FROM appearances
+    {player_filter}
+),
+ordered_seasons AS (
+    SELECT 
+        playerID,
+        yearID,
+        LAG(yearID) OVER (PARTITION BY playerID ORDER BY yearID) as prev_year
+    FROM seasons
+)
+SELECT 
+    p.nameFirst,
+    p.nameLast, 
+    s.playerID,
+    s.prev_year as last_seen_year,
+    s.yearID as return_year,
+    (s.yearID - s.prev_year - 1) as gap_years,
+    CONCAT(s.prev_year + 1, ' - ', s.yearID - 1) as gap_years_range
+FROM ordered_seasons s
+JOIN people p ON s.playerID = p.playerID
+WHERE s.prev_year IS NOT NULL
+  AND s.yearID - s.prev_year - 1 >= 1
+  AND s.yearID BETWEEN {start_year} AND {end_year}
+ORDER BY return_year, gap_years DESC;
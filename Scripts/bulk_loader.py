@@ -0,0 +1,126 @@
+import os
+import tempfile
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Index, Integer, BigInteger, Float, Boolean, DateTime, String, Text, text, inspect
+
+LOAD_METHOD = os.getenv('LOAD_METHOD', 'infile') # 'infile' tries LOAD DATA LOCAL INFILE first, 'batch' always uses executemany
+LOAD_BATCH_SIZE = int(os.getenv('LOAD_BATCH_SIZE', '10000'))
+
+def sql_type_for(dtype):
+    # Same column types df.to_sql would have picked
+    if pd.api.types.is_bool_dtype(dtype):
+        return Boolean
+    if pd.api.types.is_integer_dtype(dtype):
+        return BigInteger
+    if pd.api.types.is_float_dtype(dtype):
+        return Float(precision=53)
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return DateTime
+    return Text
+
+# Normalized player-name key (names.py) that the gap checkers join on
+NAME_KEY_TYPES = {'name_key': String(255)}
+
+def build_table(df, table_name, add_id=False, schema=None, index_columns=(), column_types=None, index_prefix=None):
+    # Final schema up front, including the id column, so no ALTER TABLE rebuild is needed afterwards.
+    # column_types overrides the inferred type, e.g. a VARCHAR for an indexed string column.
+    # index_prefix names the indexes after another table, the one a staging table is renamed to
+    column_types = column_types or {}
+    index_prefix = index_prefix or table_name
+    columns = []
+    if add_id:
+        columns.append(Column('id', Integer, primary_key=True, autoincrement=True))
+    for name, dtype in df.dtypes.items():
+        columns.append(Column(name, column_types.get(name, sql_type_for(dtype))))
+    indexes = [Index(f"idx_{index_prefix}_{c}", c) for c in index_columns]
+    return Table(table_name, MetaData(schema=schema), *columns, *indexes)
+
+def create_if_missing(engine, table, mysql_ddl=None):
+    # Creates a shared table unless it is already there; returns True when it had to be created.
+    # mysql_ddl replaces the generated CREATE TABLE on MySQL, e.g. for a partitioned layout
+    with engine.begin() as conn:
+        if conn.dialect.has_table(conn, table.name, schema=conn.schema_for_object(table)):
+            return False
+        if mysql_ddl and engine.dialect.name == 'mysql':
+            conn.execute(text(mysql_ddl))
+        else:
+            table.create(conn)
+    return True
+
+def quoted_name(schema, name):
+    return f"`{schema}`.`{name}`" if schema else f"`{name}`"
+
+def load_data_infile(conn, table, df):
+    columns = ', '.join(f"`{c}`" for c in df.columns)
+    # LOAD DATA reads True/False as strings, so booleans go into the file as 1/0
+    bool_columns = [c for c in df.columns if pd.api.types.is_bool_dtype(df[c].dtype)]
+    if bool_columns:
+        df = df.astype({c: 'Int8' for c in bool_columns})
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8', newline='') as f:
+        tmp_path = f.name
+        df.to_csv(f, header=False, index=False, na_rep='NULL', lineterminator='\n')
+    try:
+        full_name = quoted_name(table.schema, table.name)
+        path = tmp_path.replace('\\', '/')
+        conn.execute(text(
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {full_name} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            f"LINES TERMINATED BY '\\n' ({columns})"
+        ))
+    finally:
+        os.remove(tmp_path)
+
+def insert_batches(conn, table, df):
+    records = df.astype(object).where(df.notna(), None).to_dict('records')
+    for start in range(0, len(records), LOAD_BATCH_SIZE):
+        conn.execute(table.insert(), records[start:start + LOAD_BATCH_SIZE])
+
+def insert_frame(conn, table, df):
+    # Append df to an existing table inside the caller's transaction
+    if df.empty:
+        return 0
+    if LOAD_METHOD == 'infile' and conn.dialect.name == 'mysql':
+        try:
+            load_data_infile(conn, table, df)
+            return len(df)
+        except Exception as e:
+            print(f"LOAD DATA LOCAL INFILE unavailable for {table.name}, using batched inserts: {e}")
+    insert_batches(conn, table, df)
+    return len(df)
+
+def bulk_load_frame(engine, df, table_name, add_id=False, schema=None, index_columns=(), column_types=None):
+    # Replace table_name with the contents of df. Readers see the old table until the new one is complete
+    if engine.dialect.name != 'mysql':
+        # SQLite runs the DROP and CREATE inside the transaction, so the replace is one transaction
+        table = build_table(df, table_name, add_id=add_id, schema=schema, index_columns=index_columns, column_types=column_types)
+        with engine.begin() as conn:
+            table.drop(conn, checkfirst=True)
+            table.create(conn)
+            insert_frame(conn, table, df)
+        return len(df)
+
+    # MySQL commits on every CREATE and DROP, so the rows go into <table>_new first and one
+    # RENAME TABLE swaps it in. A failed load leaves the old table as it was.
+    staging = build_table(df, f"{table_name}_new", add_id=add_id, schema=schema, index_columns=index_columns,
+                          column_types=column_types, index_prefix=table_name)
+    with engine.begin() as conn:
+        staging.drop(conn, checkfirst=True)
+        staging.create(conn)
+    try:
+        with engine.begin() as conn:
+            insert_frame(conn, staging, df)
+    except Exception:
+        with engine.begin() as conn:
+            staging.drop(conn, checkfirst=True)
+        raise
+
+    target, new, old = (quoted_name(schema, name) for name in (table_name, staging.name, f"{table_name}_old"))
+    with engine.begin() as conn:
+        if inspect(conn).has_table(table_name, schema=schema):
+            conn.execute(text(f"DROP TABLE IF EXISTS {old}"))
+            conn.execute(text(f"RENAME TABLE {target} TO {old}, {new} TO {target}"))
+            conn.execute(text(f"DROP TABLE {old}"))
+        else:
+            conn.execute(text(f"RENAME TABLE {new} TO {target}"))
+
+    return len(df)
@@ -0,0 +1,70 @@
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, SmallInteger, String, Text, Float, Index, text
+from bulk_loader import create_if_missing, insert_frame
+
+# Every MLB player's matched MiLB/NPB player-seasons, kept so gap details and later analysis are joins
+# instead of another round of name matching. Rebuilt one (league, season) at a time by gap_engine.update_crosswalk().
+CROSSWALK_SCHEMA = 'baseball_db'
+CROSSWALK_TABLE = 'player_crosswalk'
+CROSSWALK_COLUMNS = ['playerID', 'league', 'season', 'player_name', 'level', 'team', 'org', 'match_method', 'score']
+
+player_crosswalk = Table(CROSSWALK_TABLE, MetaData(schema=CROSSWALK_SCHEMA),
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('playerID', String(16), nullable=False),
+    Column('league', String(16), nullable=False),
+    Column('season', SmallInteger, nullable=False),
+    Column('player_name', String(255)),
+    Column('level', String(64)),
+    Column('team', Text),
+    Column('org', Text),
+    Column('match_method', String(16), nullable=False), # 'exact' or 'fuzzy'
+    Column('score', Float), # 1.0 for exact matches
+    Index('idx_crosswalk_player_league_season', 'playerID', 'league', 'season'),
+    Index('idx_crosswalk_league_season', 'league', 'season')
+)
+
+def create_crosswalk(engine):
+    # Returns True when the table had to be created
+    return create_if_missing(engine, player_crosswalk)
+
+def crosswalk_seasons(engine, league):
+    with engine.connect() as conn:
+        rows = conn.execute(player_crosswalk.select().with_only_columns(player_crosswalk.c.season).distinct()
+                            .where(player_crosswalk.c.league == league)).fetchall()
+    return {row[0] for row in rows}
+
+def replace_crosswalk_season(engine, league, season, df):
+    # df: CROSSWALK_COLUMNS rows for one league and season, in the order they should be reported
+    with engine.begin() as conn:
+        conn.execute(player_crosswalk.delete().where((player_crosswalk.c.league == league) & (player_crosswalk.c.season == season)))
+        insert_frame(conn, player_crosswalk, df)
+    return len(df)
+
+def delete_crosswalk_season(engine, league, season):
+    with engine.begin() as conn:
+        conn.execute(player_crosswalk.delete().where((player_crosswalk.c.league == league) & (player_crosswalk.c.season == season)))
+
+def gap_crosswalk_rows(engine, table, years):
+    # Crosswalk rows inside each result row's gap, joined in the database: one row per (result id, match).
+    # years: (first, last) return years of the result rows to join
+    sql = f"""
+        SELECT r.id, c.league, c.season, c.player_name, c.level, c.team, c.org, c.score
+        FROM {table} r
+        JOIN {CROSSWALK_SCHEMA}.{CROSSWALK_TABLE} c
+          ON c.playerID = r.playerID AND c.season > r.last_seen_year AND c.season < r.return_year
+        WHERE r.return_year BETWEEN :first AND :last
+        ORDER BY r.id, c.season, c.id
+    """
+    return pd.read_sql(text(sql), engine, params={'first': years[0], 'last': years[1]})
+
+def namesake_ids(engine, table, league, years):
+    # Result rows whose player also matches a player of the league in their last or return MLB season
+    sql = f"""
+        SELECT DISTINCT r.id
+        FROM {table} r
+        JOIN {CROSSWALK_SCHEMA}.{CROSSWALK_TABLE} c
+          ON c.playerID = r.playerID AND c.league = :league AND (c.season = r.last_seen_year OR c.season = r.return_year)
+        WHERE r.return_year BETWEEN :first AND :last
+    """
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(sql), {'league': league, 'first': years[0], 'last': years[1]})}
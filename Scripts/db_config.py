@@ -1,6 +1,10 @@
 import os
+import threading
+import zlib
 from dotenv import load_dotenv, find_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from instrumentation import instrument_engine
+from sql_profiler import SQL_PROFILE, profile_engine
 
 # Load environment variables from .env file
 load_dotenv(find_dotenv())
@@ -10,7 +14,19 @@ DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_HOST = os.getenv('DB_HOST')
 DB_PORT = os.getenv('DB_PORT')
 
+# 'mysql' (default) or 'sqlite', which keeps each schema in a local file and needs no server
+DB_BACKEND = os.getenv('DB_BACKEND', 'mysql')
+SQLITE_DIR = os.getenv('SQLITE_DIR', os.path.join('Data', 'sqlite'))
+SCHEMAS = ['baseball_db', 'milb', 'npb', 'yearly_results']
+
+# One pooled engine per schema for the life of the process
+_engines = {}
+_engines_lock = threading.Lock()
+
 def get_connection_string(schema=None):
+    if DB_BACKEND == 'sqlite':
+        return f"sqlite:///{sqlite_path(schema or 'baseball_db')}"
+
     if not all([DB_USER, DB_PASSWORD, DB_HOST, DB_PORT]):
         raise ValueError("Database configuration missing in .env file")
     
@@ -20,6 +36,68 @@ def get_connection_string(schema=None):
         return f"{base_string}/{schema}"
     return base_string
 
+def sqlite_path(schema):
+    return os.path.join(SQLITE_DIR, f"{schema}.sqlite")
+
+def sqlite_concat(*args):
+    # MySQL CONCAT(): NULL if any argument is NULL
+    if any(a is None for a in args):
+        return None
+    return ''.join(str(a) for a in args)
+
+def sqlite_concat_ws(separator, *args):
+    # MySQL CONCAT_WS(): NULL arguments are skipped
+    return separator.join(str(a) for a in args if a is not None)
+
+def sqlite_crc32(value):
+    if value is None:
+        return None
+    return zlib.crc32(str(value).encode('utf-8'))
+
+def get_sqlite_engine(schema=None):
+    # The engine's own schema is the main database and the other schemas are attached under
+    # their names, so cross-schema references like yearly_results.<table> work as on MySQL.
+    schema = schema or 'baseball_db'
+    if not os.path.exists(SQLITE_DIR):
+        os.makedirs(SQLITE_DIR)
+    engine = instrument_engine(create_engine(get_connection_string(schema)))
+
+    @event.listens_for(engine, 'connect')
+    def attach_schemas(dbapi_connection, connection_record):
+        for other in SCHEMAS:
+            if other != schema:
+                dbapi_connection.execute(f"ATTACH DATABASE '{sqlite_path(other)}' AS {other}")
+        dbapi_connection.create_function('CONCAT', -1, sqlite_concat)
+        dbapi_connection.create_function('CONCAT_WS', -1, sqlite_concat_ws)
+        dbapi_connection.create_function('CRC32', 1, sqlite_crc32)
+
+    # A database cannot be attached to itself, so Table objects qualified with the engine's own schema map to main
+    return engine.execution_options(schema_translate_map={schema: None})
+
+def is_sqlite(engine):
+    return engine.dialect.name == 'sqlite'
+
+def create_engine_for(schema=None):
+    if DB_BACKEND == 'sqlite':
+        engine = get_sqlite_engine(schema)
+    else:
+        conn_string = get_connection_string(schema)
+        # local_infile lets the bulk loader use LOAD DATA LOCAL INFILE
+        engine = instrument_engine(create_engine(conn_string, connect_args={'local_infile': True}))
+    if SQL_PROFILE:
+        profile_engine(engine)
+    return engine
+
 def get_engine(schema=None):
-    conn_string = get_connection_string(schema)
-    return create_engine(conn_string)
+    # Keyed by pid as well, so a forked worker process never shares pooled connections with its parent
+    key = (os.getpid(), schema)
+    with _engines_lock:
+        if key not in _engines:
+            _engines[key] = create_engine_for(schema)
+        return _engines[key]
+
+def dispose_engines():
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
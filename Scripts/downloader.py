@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import threading
+from email.utils import formatdate
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from instrumentation import count_bytes
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://proeyekyuu.com/csvs/'
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate # tokens per second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def parse_rate_limits(value):
+    # "proeyekyuu.com=1,github.com=4" -> {'proeyekyuu.com': 1.0, 'github.com': 4.0}
+    limits = {}
+    for part in (value or '').split(','):
+        if '=' in part:
+            host, rate = part.split('=', 1)
+            limits[host.strip()] = float(rate)
+    return limits
+
+class Downloader:
+    def __init__(self, max_workers=8, rate_limits=None, default_rate=4.0, max_retries=3, backoff=1.0,
+                 timeout=60, headers=None, validators_path=None):
+        self.max_workers = max_workers
+        self.rate_limits = rate_limits or {}
+        self.default_rate = default_rate
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # One keep-alive session shared by every worker
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS if headers is None else headers)
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.buckets = {}
+        self.buckets_lock = threading.Lock()
+
+        # ETag / Last-Modified of every file we have downloaded, keyed by destination path
+        self.validators_path = validators_path
+        self.validators = {}
+        self.validators_lock = threading.Lock()
+        if validators_path and os.path.exists(validators_path):
+            with open(validators_path, 'r') as f:
+                self.validators = json.load(f)
+
+    def _bucket(self, url):
+        host = urlparse(url).hostname or ''
+        with self.buckets_lock:
+            if host not in self.buckets:
+                rate = self.default_rate
+                for pattern, host_rate in self.rate_limits.items():
+                    if host == pattern or host.endswith('.' + pattern):
+                        rate = host_rate
+                self.buckets[host] = TokenBucket(rate)
+            return self.buckets[host]
+
+    def request(self, url, headers=None, stream=False):
+        # Rate-limited GET with retries and exponential backoff on connection errors and 429/5xx
+        for attempt in range(self.max_retries + 1):
+            self._bucket(url).acquire()
+            try:
+                response = self.session.get(url, headers=headers, stream=stream, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Retrying {url} after error: {e}")
+                time.sleep(self.backoff * (2 ** attempt))
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                retry_after = response.headers.get('Retry-After')
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * (2 ** attempt)
+                response.close()
+                time.sleep(delay)
+                continue
+            return response
+
+    def get_text(self, url):
+        response = self.request(url)
+        response.raise_for_status()
+        count_bytes(len(response.content))
+        return response.text
+
+    def _conditional_headers(self, dest_path):
+        headers = {}
+        if not os.path.exists(dest_path):
+            return headers
+        with self.validators_lock:
+            stored = self.validators.get(dest_path, {})
+        if stored.get('etag'):
+            headers['If-None-Match'] = stored['etag']
+        if stored.get('last_modified'):
+            headers['If-Modified-Since'] = stored['last_modified']
+        elif not headers:
+            headers['If-Modified-Since'] = formatdate(os.path.getmtime(dest_path), usegmt=True)
+        return headers
+
+    def fetch(self, url, dest_path, revalidate=True):
+        # Returns 'downloaded', 'not_modified', 'skipped' or 'failed'
+        if os.path.exists(dest_path) and not revalidate:
+            return 'skipped'
+        try:
+            response = self.request(url, headers=self._conditional_headers(dest_path), stream=True)
+            with response:
+                if response.status_code == 304:
+                    return 'not_modified'
+                if response.status_code != 200:
+                    print(f"Failed to download (Status {response.status_code}): {url}")
+                    return 'failed'
+
+                # Write to a partial file first so an interrupted download never looks complete
+                part_path = dest_path + '.part'
+                with open(part_path, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=65536):
+                        f.write(chunk)
+                        count_bytes(len(chunk))
+                os.replace(part_path, dest_path)
+
+                with self.validators_lock:
+                    self.validators[dest_path] = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')
+                    }
+            return 'downloaded'
+        except Exception as e:
+            print(f"Error downloading {url}: {e}")
+            return 'failed'
+
+    def fetch_resumable(self, url, dest_path):
+        # Stream a large file to disk, resuming an interrupted transfer with a Range request
+        part_path = dest_path + '.part'
+        for attempt in range(self.max_retries + 1):
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else None
+            try:
+                response = self.request(url, headers=headers, stream=True)
+                with response:
+                    if response.status_code == 416:
+                        # Nothing left to send: the partial file is already complete
+                        break
+                    response.raise_for_status()
+                    if response.status_code == 206:
+                        mode = 'ab'
+                        print(f"Resuming {os.path.basename(dest_path)} at {offset} bytes...")
+                    else:
+                        mode = 'wb' # Server ignored the Range header, start over
+                    with open(part_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=1024 * 1024):
+                            f.write(chunk)
+                            count_bytes(len(chunk))
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Transfer of {url} interrupted ({e}), resuming...")
+                time.sleep(self.backoff * (2 ** attempt))
+
+        os.replace(part_path, dest_path)
+        return dest_path
+
+    def download_all(self, jobs, revalidate=True, on_complete=None):
+        # jobs: list of (url, dest_path). Returns {dest_path: status}.
+        # on_complete(dest_path, status) is called from this thread as each file finishes.
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch, url, dest_path, revalidate): dest_path for url, dest_path in jobs}
+            for i, future in enumerate(as_completed(futures)):
+                dest_path = futures[future]
+                results[dest_path] = future.result()
+                if results[dest_path] == 'downloaded':
+                    print(f"[{i+1}/{len(jobs)}] Downloaded {os.path.basename(dest_path)}")
+                if on_complete:
+                    on_complete(dest_path, results[dest_path])
+        self.save_validators()
+        return results
+
+    def save_validators(self):
+        if not self.validators_path:
+            return
+        with self.validators_lock:
+            tmp_path = self.validators_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.validators, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.validators_path)
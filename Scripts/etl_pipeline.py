@@ -1,21 +1,25 @@
 import os
-import requests
 import re
-import time
 import pandas as pd
 import zipfile
-import io
 import shutil
-from sqlalchemy import create_engine, text
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from sqlalchemy import inspect
+import db_config
 from dotenv import load_dotenv, find_dotenv
+from downloader import Downloader, parse_rate_limits
+from bulk_loader import bulk_load_frame, NAME_KEY_TYPES
+from names import clean_npb_names, normalize_names
+from manifest import Manifest
+from processed_io import processed_path, write_processed, read_processed, list_processed
+from player_seasons import create_player_seasons, replace_player_seasons_source
+from instrumentation import instrumented_run, stage, count_rows
 
 load_dotenv(find_dotenv())
 
-DB_USER = os.getenv('DB_USER')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-
 # Directories
 DATA_DIR = 'Data'
 MILB_RAW_DIR = os.path.join(DATA_DIR, 'MiLB')
@@ -23,81 +27,128 @@ MILB_PROCESSED_DIR = os.path.join(DATA_DIR, 'MiLB_Yearly')
 NPB_RAW_DIR = os.path.join(DATA_DIR, 'NPB')
 NPB_PROCESSED_DIR = os.path.join(DATA_DIR, 'NPB_Yearly')
 
-# URLs
-LAHMAN_URL = "https://github.com/chadwickbureau/baseballdatabank/archive/refs/tags/v2023.1.zip"
-MILB_RELEASE_URL = "https://github.com/armstjc/milb-data-repository/releases/expanded_assets/game_player_stats"
-NPB_BATTING_URL_PATTERN = "https://proeyekyuu.com/wp-content/CsvExports/PlayerSLBattingEN/player_batting_stats_en_{year}.csv"
-NPB_PITCHING_URL_PATTERN = "https://proeyekyuu.com/wp-content/CsvExports/PlayerSLPitchingEN/player_pitching_stats_en_{year}.csv"
+LAHMAN_ARCHIVE = os.path.join(DATA_DIR, 'baseballdatabank.zip')
+LAHMAN_TABLES = [t.strip() for t in os.getenv('LAHMAN_TABLES', 'People,Appearances').split(',') if t.strip()] # e.g. People,Appearances,Batting,Pitching,Fielding
+
+# URLs. The base URLs can point at a mirror or a local stand-in server
+GITHUB_BASE_URL = os.getenv('GITHUB_BASE_URL', 'https://github.com').rstrip('/')
+NPB_BASE_URL = os.getenv('NPB_BASE_URL', 'https://proeyekyuu.com').rstrip('/')
+LAHMAN_URL = f"{GITHUB_BASE_URL}/chadwickbureau/baseballdatabank/archive/refs/tags/v2023.1.zip"
+MILB_RELEASE_URL = f"{GITHUB_BASE_URL}/armstjc/milb-data-repository/releases/expanded_assets/game_player_stats"
+NPB_BATTING_URL_PATTERN = NPB_BASE_URL + "/wp-content/CsvExports/PlayerSLBattingEN/player_batting_stats_en_{year}.csv"
+NPB_PITCHING_URL_PATTERN = NPB_BASE_URL + "/wp-content/CsvExports/PlayerSLPitchingEN/player_pitching_stats_en_{year}.csv"
+
+# Download settings
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '8'))
+DOWNLOAD_RATE_LIMITS = parse_rate_limits(os.getenv('DOWNLOAD_RATE_LIMITS', 'proeyekyuu.com=2,github.com=5')) # requests per second, per host
+DOWNLOAD_DEFAULT_RATE = float(os.getenv('DOWNLOAD_DEFAULT_RATE', '4'))
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', '3'))
+DOWNLOAD_REVALIDATE = os.getenv('DOWNLOAD_REVALIDATE', '1') == '1' # Send conditional requests for files we already have
+
+_downloader = None
+_manifest = None
+
+# Loading settings
+LOAD_LAYOUT = os.getenv('LOAD_LAYOUT', 'per_season') # 'per_season' tables, one 'consolidated' baseball_db.player_seasons table, or 'both'
+
+# Processing settings
+PROCESS_WORKERS = int(os.getenv('PROCESS_WORKERS', str(os.cpu_count() or 1))) # 1 processes every group in this process
+# 'chunked' folds each raw MiLB file into a per-player accumulator a chunk at a time; 'concat' reads the whole group first
+MILB_AGGREGATION = os.getenv('MILB_AGGREGATION', 'chunked')
+MILB_CHUNK_SIZE = int(os.getenv('MILB_CHUNK_SIZE', '100000'))
+MILB_RAW_COLUMNS = ['player_full_name', 'league_level_name', 'team_name', 'team_org_name']
+
+# 'phased' downloads everything, then processes everything, then loads everything.
+# 'streaming' hands each MiLB (season, level) group / NPB year on as soon as its inputs are complete.
+PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'phased')
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '4')) # groups waiting between stages before the previous stage blocks
+
+MILB_FILENAME_PATTERN = re.compile(r'(\d{4})_(\d{1,2})_([a-zA-Z0-9\+\-]+)_player_game_stats\.csv')
 
 def get_engine(schema=None):
-    if not all([DB_USER, DB_PASSWORD, DB_HOST, DB_PORT]):
-        print("Error: Database configuration missing in .env file")
+    try:
+        return db_config.get_engine(schema)
+    except ValueError as e:
+        print(f"Error: {e}")
         return None
-    
-    base_string = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}"
-    if schema:
-        return create_engine(f"{base_string}/{schema}")
-    return create_engine(base_string)
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
+def get_downloader():
+    global _downloader
+    if _downloader is None:
+        _downloader = Downloader(
+            max_workers=DOWNLOAD_WORKERS,
+            rate_limits=DOWNLOAD_RATE_LIMITS,
+            default_rate=DOWNLOAD_DEFAULT_RATE,
+            max_retries=DOWNLOAD_RETRIES,
+            validators_path=os.path.join(DATA_DIR, 'download_validators.json')
+        )
+    return _downloader
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        _manifest = Manifest(os.path.join(DATA_DIR, 'manifest.json'))
+    return _manifest
+
 def download_file(url, dest_path):
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Referer': 'https://proeyekyuu.com/csvs/'
-        }
-        response = requests.get(url, headers=headers, stream=True)
-        if response.status_code == 200:
-            with open(dest_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return True
-        else:
-            print(f"Failed to download (Status {response.status_code}): {url}")
-            return False
-    except Exception as e:
-        print(f"Error downloading {url}: {e}")
-        return False
+    ensure_dir(DATA_DIR)
+    status = get_downloader().fetch(url, dest_path)
+    get_downloader().save_validators()
+    return status in ('downloaded', 'not_modified')
 
 # Download Lahman Data
+def extract_lahman_tables(archive_path, tables):
+    with zipfile.ZipFile(archive_path) as z:
+        for file_info in z.infolist():
+            for table in tables:
+                if file_info.filename.endswith(f'core/{table}.csv'):
+                    print(f"Extracting {table}.csv...")
+                    with z.open(file_info) as source, open(os.path.join(DATA_DIR, f'{table}.csv'), 'wb') as target:
+                        shutil.copyfileobj(source, target)
+
+def lahman_table_current(table):
+    csv_path = os.path.join(DATA_DIR, f'{table}.csv')
+    if not os.path.exists(csv_path):
+        return False
+    if not os.path.exists(LAHMAN_ARCHIVE):
+        return True # Extracted before the archive was kept on disk
+    return get_manifest().is_current(f"extract:{table}", [LAHMAN_ARCHIVE], [csv_path])
+
 def download_lahman_data():
     print("\n--- Downloading Lahman's Data ---")
     ensure_dir(DATA_DIR)
     
-    # Check if files already exist
-    if os.path.exists(os.path.join(DATA_DIR, 'People.csv')) and os.path.exists(os.path.join(DATA_DIR, 'Appearances.csv')):
+    # Check if files already exist and match the archive they came from
+    missing_tables = [t for t in LAHMAN_TABLES if not lahman_table_current(t)]
+    if not missing_tables:
         return
 
     try:
-        response = requests.get(LAHMAN_URL)
-        response.raise_for_status()
+        # The archive is kept on disk so more tables can be extracted later without downloading again
+        if not os.path.exists(LAHMAN_ARCHIVE):
+            get_downloader().fetch_resumable(LAHMAN_URL, LAHMAN_ARCHIVE)
         
-        with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-            for file_info in z.infolist():
-                if file_info.filename.endswith('core/People.csv'):
-                    print("Extracting People.csv...")
-                    with z.open(file_info) as source, open(os.path.join(DATA_DIR, 'People.csv'), 'wb') as target:
-                        shutil.copyfileobj(source, target)
-                elif file_info.filename.endswith('core/Appearances.csv'):
-                    print("Extracting Appearances.csv...")
-                    with z.open(file_info) as source, open(os.path.join(DATA_DIR, 'Appearances.csv'), 'wb') as target:
-                        shutil.copyfileobj(source, target)
+        extract_lahman_tables(LAHMAN_ARCHIVE, missing_tables)
+        for table in missing_tables:
+            get_manifest().record(f"extract:{table}", [LAHMAN_ARCHIVE], [os.path.join(DATA_DIR, f'{table}.csv')])
+        get_manifest().save()
+    except zipfile.BadZipFile as e:
+        print(f"Error reading Lahman archive, it will be downloaded again next run: {e}")
+        os.remove(LAHMAN_ARCHIVE)
     except Exception as e:
         print(f"Error downloading Lahman data: {e}")
 
 # Download MiLB Data
 def get_milb_links(url):
     try:
-        response = requests.get(url)
-        response.raise_for_status()
+        page = get_downloader().get_text(url)
         pattern = r'href="(/armstjc/milb-data-repository/releases/download/game_player_stats/[^"]+\.csv)"'
-        links = re.findall(pattern, response.text)
-        return list(set([f"https://github.com{link}" for link in links]))
+        links = re.findall(pattern, page)
+        return list(set([f"{GITHUB_BASE_URL}{link}" for link in links]))
     except Exception as e:
         print(f"Error fetching MiLB page: {e}")
         return []
@@ -107,148 +158,273 @@ def download_milb_data():
     
     links = get_milb_links(MILB_RELEASE_URL)
     
-    for i, link in enumerate(links):
-        filename = link.split("/")[-1]
-        filepath = os.path.join(MILB_RAW_DIR, filename)
-        
-        if not os.path.exists(filepath):
-            print(f"[{i+1}/{len(links)}] Downloading {filename}...")
-            download_file(link, filepath)
-            time.sleep(0.5)
-        else:
-            pass
+    jobs = [(link, os.path.join(MILB_RAW_DIR, link.split("/")[-1])) for link in links]
+    print(f"Checking {len(jobs)} MiLB files...")
+    get_downloader().download_all(jobs, revalidate=DOWNLOAD_REVALIDATE)
 
 # Download NPB Data
-def download_npb_data():
-    ensure_dir(NPB_RAW_DIR)
-    
+def npb_download_jobs():
     start_year = 1950
     end_year = 2025
     
+    jobs = []
     for year in range(start_year, end_year + 1):
-        batting_file = os.path.join(NPB_RAW_DIR, f"npb_batting_{year}.csv")
-        if not os.path.exists(batting_file):
-            download_file(NPB_BATTING_URL_PATTERN.format(year=year), batting_file)
-            time.sleep(1)
-            
-        pitching_file = os.path.join(NPB_RAW_DIR, f"npb_pitching_{year}.csv")
-        if not os.path.exists(pitching_file):
-            download_file(NPB_PITCHING_URL_PATTERN.format(year=year), pitching_file)
-            time.sleep(1)
+        jobs.append((NPB_BATTING_URL_PATTERN.format(year=year), os.path.join(NPB_RAW_DIR, f"npb_batting_{year}.csv")))
+        jobs.append((NPB_PITCHING_URL_PATTERN.format(year=year), os.path.join(NPB_RAW_DIR, f"npb_pitching_{year}.csv")))
+    return jobs
+
+def download_npb_data():
+    ensure_dir(NPB_RAW_DIR)
+    
+    jobs = npb_download_jobs()
+    print(f"Checking {len(jobs)} NPB files...")
+    get_downloader().download_all(jobs, revalidate=DOWNLOAD_REVALIDATE)
 
 # Process Data
-def process_milb_data():
-    ensure_dir(MILB_PROCESSED_DIR)
+def aggregate_player_seasons(df):
+    # One row per (Season, Player Name, League Level) with its sorted, de-duplicated teams and orgs
+    keys = ['Season', 'Player Name', 'League Level']
+    df = df.dropna(subset=keys)
+    result_df = df[keys].drop_duplicates()
+
+    for column in ['Team Name', 'Team Org']:
+        values = df[keys + [column]].dropna(subset=[column]).astype({column: str}).drop_duplicates()
+        values = values.sort_values(keys + [column])
+        joined = values.groupby(keys, sort=False)[column].agg(', '.join).reset_index()
+        result_df = result_df.merge(joined, on=keys, how='left')
+        result_df[column] = result_df[column].fillna('')
+
+    return result_df.sort_values(by=['Player Name', 'League Level'])
+
+def process_pool(workers):
+    # Workers come from a forkserver (spawn where there is none), not a fork of this process: the download,
+    # loader and instrumentation threads are running by then, and a forked child could inherit a lock
+    # one of them held (stdout, the run's counters) and hang on it
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+def run_groups(func, jobs, label):
+    # jobs: [(name, args), ...] for a func returning (rows_read, rows_written).
+    # Each group runs on its own; errors are collected instead of stopping the run
+    results = {}
+    errors = {}
+    if PROCESS_WORKERS <= 1:
+        for name, args in jobs:
+            try:
+                results[name] = func(*args)
+            except Exception as e:
+                errors[name] = str(e)
+    else:
+        with process_pool(PROCESS_WORKERS) as executor:
+            futures = {executor.submit(func, *args): name for name, args in jobs}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    errors[name] = str(e)
+
+    rows_in = sum(r[0] for r in results.values())
+    rows_out = sum(r[1] for r in results.values())
+    count_rows(rows_in=rows_in, rows_out=rows_out)
+    print(f"{label}: {len(results)} groups processed, {rows_in} rows read, {rows_out} rows written, {len(errors)} errors")
+    for name in sorted(errors):
+        print(f"  Error processing {name}: {errors[name]}")
+    return results, errors
+
+def record_processed(results, stage_files):
+    # Remember which raw inputs produced each processed file that was written
+    manifest = get_manifest()
+    for name in results:
+        key, inputs, outputs = stage_files[name]
+        if all(os.path.exists(path) for path in outputs):
+            manifest.record(key, inputs, outputs)
+    manifest.save()
+
+def process_milb_group(season, level_code, file_paths, output_path):
+    if MILB_AGGREGATION == 'chunked':
+        return process_milb_group_chunked(season, level_code, file_paths, output_path)
+
+    dfs = []
+    for file_path in sorted(file_paths):
+        try:
+            df = pd.read_csv(file_path, usecols=MILB_RAW_COLUMNS)
+            dfs.append(df)
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
     
-    filename_pattern = re.compile(r'(\d{4})_(\d{1,2})_([a-zA-Z0-9\+\-]+)_player_game_stats\.csv')
-    file_groups = {}
+    if not dfs:
+        return 0, 0
+
+    combined_df = pd.concat(dfs, ignore_index=True)
+    combined_df['Season'] = season
+    combined_df.rename(columns={
+        'player_full_name': 'Player Name',
+        'league_level_name': 'League Level',
+        'team_name': 'Team Name',
+        'team_org_name': 'Team Org'
+    }, inplace=True)
+    
+    result_df = aggregate_player_seasons(combined_df)
+    write_processed(result_df, output_path)
+    return len(combined_df), len(result_df)
+
+def fold_milb_chunk(players, chunk):
+    # players: the distinct (name, level, team, org) rows seen so far, which is all aggregate_player_seasons needs
+    chunk = chunk.dropna(subset=['player_full_name', 'league_level_name']).drop_duplicates()
+    if players is None:
+        return chunk
+    return pd.concat([players, chunk], ignore_index=True).drop_duplicates()
+
+def process_milb_group_chunked(season, level_code, file_paths, output_path):
+    # Same output as the concat mode, but memory grows with the distinct players, not the games
+    dtypes = {c: 'category' for c in MILB_RAW_COLUMNS}
+    players = None
+    rows_in = 0
+    files_read = 0
+    for file_path in sorted(file_paths):
+        # A file that fails part way through is left out entirely, as in the concat mode
+        file_players = None
+        file_rows = 0
+        try:
+            for chunk in pd.read_csv(file_path, usecols=MILB_RAW_COLUMNS, dtype=dtypes, chunksize=MILB_CHUNK_SIZE):
+                file_rows += len(chunk)
+                file_players = fold_milb_chunk(file_players, chunk)
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+            continue
+        if file_players is not None:
+            players = fold_milb_chunk(players, file_players)
+        rows_in += file_rows
+        files_read += 1
+
+    if not files_read:
+        return 0, 0
 
+    if players is None:
+        players = pd.DataFrame(columns=MILB_RAW_COLUMNS)
+    players = players.astype(object).rename(columns={
+        'player_full_name': 'Player Name',
+        'league_level_name': 'League Level',
+        'team_name': 'Team Name',
+        'team_org_name': 'Team Org'
+    })
+    players.insert(0, 'Season', season)
+    result_df = aggregate_player_seasons(players)
+    write_processed(result_df, output_path)
+    return rows_in, len(result_df)
+
+def milb_group_key(filename):
+    # 2007_4_aaa_player_game_stats.csv -> ('2007', 'aaa')
+    match = MILB_FILENAME_PATTERN.match(filename) if filename.endswith("_player_game_stats.csv") else None
+    if not match:
+        return None
+    season, month, level_code = match.groups()
+    return season, level_code
+
+def milb_groups_on_disk():
+    file_groups = {}
     for filename in os.listdir(MILB_RAW_DIR):
-        if filename.endswith("_player_game_stats.csv"):
-            match = filename_pattern.match(filename)
-            if match:
-                season, month, level_code = match.groups()
-                key = (season, level_code)
-                if key not in file_groups:
-                    file_groups[key] = []
-                file_groups[key].append(os.path.join(MILB_RAW_DIR, filename))
-
-    for (season, level_code), file_paths in file_groups.items():
-        output_filename = f"MiLB_{season}_{level_code}.csv"
-        output_path = os.path.join(MILB_PROCESSED_DIR, output_filename)
-        
-        if os.path.exists(output_path):
+        key = milb_group_key(filename)
+        if key:
+            file_groups.setdefault(key, []).append(os.path.join(MILB_RAW_DIR, filename))
+    return file_groups
+
+def milb_job(season, level_code, file_paths):
+    # (name, args for process_milb_group, (manifest key, inputs, outputs))
+    output_path = processed_path(MILB_PROCESSED_DIR, f"MiLB_{season}_{level_code}")
+    key = f"process:{os.path.basename(output_path)}"
+    return f"MiLB {season} {level_code}", (season, level_code, file_paths, output_path), (key, file_paths, [output_path])
+
+def process_milb_data():
+    ensure_dir(MILB_PROCESSED_DIR)
+
+    manifest = get_manifest()
+    jobs = []
+    stage_files = {}
+    for (season, level_code), file_paths in sorted(milb_groups_on_disk().items()):
+        name, args, files = milb_job(season, level_code, file_paths)
+
+        # Skip groups whose raw files are unchanged since the output was written
+        if manifest.is_current(*files):
             continue
 
-        dfs = []
-        for file_path in file_paths:
-            try:
-                df = pd.read_csv(file_path, usecols=['player_full_name', 'league_level_name', 'team_name', 'team_org_name'])
-                dfs.append(df)
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
+        jobs.append((name, args))
+        stage_files[name] = files
+
+    results, errors = run_groups(process_milb_group, jobs, "MiLB processing")
+    record_processed(results, stage_files)
+    return results, errors
+
+def process_npb_year(year, batting_file, pitching_file, output_file):
+    dfs = []
+    
+    if os.path.exists(batting_file):
+        try:
+            df = pd.read_csv(batting_file)
+            if 'Name' in df.columns and 'Team' in df.columns: dfs.append(df[['Season', 'Name', 'Team']])
+        except: pass
+    
+    if os.path.exists(pitching_file):
+        try:
+            df = pd.read_csv(pitching_file)
+            if 'Name' in df.columns and 'Team' in df.columns: dfs.append(df[['Season', 'Name', 'Team']])
+        except: pass
         
-        if dfs:
-            combined_df = pd.concat(dfs, ignore_index=True)
-            combined_df['Season'] = season
-            combined_df.rename(columns={
-                'player_full_name': 'Player Name',
-                'league_level_name': 'League Level',
-                'team_name': 'Team Name',
-                'team_org_name': 'Team Org'
-            }, inplace=True)
-            
-            result_df = combined_df.groupby(['Season', 'Player Name', 'League Level'], as_index=False).agg({
-                'Team Name': lambda x: ', '.join(sorted(set(x.dropna().astype(str)))),
-                'Team Org': lambda x: ', '.join(sorted(set(x.dropna().astype(str))))
-            })
-            result_df.sort_values(by=['Player Name'], inplace=True)
-            result_df.to_csv(output_path, index=False)
-
-def clean_npb_name(html_name):
-    if not isinstance(html_name, str): return ""
-    name_text = html_name
-    match = re.search(r'>([^<]+)<', html_name)
-    if match: name_text = match.group(1)
-    if ',' in name_text:
-        parts = name_text.split(',')
-        if len(parts) >= 2: return f"{parts[1].strip()} {parts[0].strip()}"
-    return name_text.strip()
+    if not dfs:
+        return 0, 0
+
+    combined = pd.concat(dfs, ignore_index=True)
+    combined['Player Name'] = clean_npb_names(combined['Name'])
+    combined['League Level'] = 'NPB'
+    combined['Team Org'] = combined['Team']
+    combined.rename(columns={'Team': 'Team Name'}, inplace=True)
+    
+    final_df = aggregate_player_seasons(combined[['Season', 'Player Name', 'League Level', 'Team Name', 'Team Org']])
+    write_processed(final_df, output_file)
+    return len(combined), len(final_df)
+
+def npb_year(filename):
+    match = re.search(r'_(\d{4})\.csv', filename)
+    return int(match.group(1)) if match else None
+
+def npb_job(year):
+    # (name, args for process_npb_year, (manifest key, inputs, outputs))
+    output_file = processed_path(NPB_PROCESSED_DIR, f"NPB_{year}")
+    batting_file = os.path.join(NPB_RAW_DIR, f"npb_batting_{year}.csv")
+    pitching_file = os.path.join(NPB_RAW_DIR, f"npb_pitching_{year}.csv")
+    input_files = [f for f in (batting_file, pitching_file) if os.path.exists(f)]
+    key = f"process:{os.path.basename(output_file)}"
+    return f"NPB {year}", (year, batting_file, pitching_file, output_file), (key, input_files, [output_file])
 
 def process_npb_data():
     ensure_dir(NPB_PROCESSED_DIR)
     
     # Find all years
-    years = set()
-    for f in os.listdir(NPB_RAW_DIR):
-        match = re.search(r'_(\d{4})\.csv', f)
-        if match: years.add(int(match.group(1)))
+    years = {npb_year(f) for f in os.listdir(NPB_RAW_DIR)} - {None}
     
+    manifest = get_manifest()
+    jobs = []
+    stage_files = {}
     for year in sorted(years):
-        output_file = os.path.join(NPB_PROCESSED_DIR, f"NPB_{year}.csv")
-        if os.path.exists(output_file):
+        name, args, files = npb_job(year)
+        if manifest.is_current(*files):
             continue
 
-        dfs = []
-        batting_file = os.path.join(NPB_RAW_DIR, f"npb_batting_{year}.csv")
-        pitching_file = os.path.join(NPB_RAW_DIR, f"npb_pitching_{year}.csv")
-        
-        if os.path.exists(batting_file):
-            try:
-                df = pd.read_csv(batting_file)
-                if 'Name' in df.columns and 'Team' in df.columns: dfs.append(df[['Season', 'Name', 'Team']])
-            except: pass
-        
-        if os.path.exists(pitching_file):
-            try:
-                df = pd.read_csv(pitching_file)
-                if 'Name' in df.columns and 'Team' in df.columns: dfs.append(df[['Season', 'Name', 'Team']])
-            except: pass
-            
-        if dfs:
-            combined = pd.concat(dfs, ignore_index=True)
-            combined['Player Name'] = combined['Name'].apply(clean_npb_name)
-            combined['League Level'] = 'NPB'
-            combined['Team Org'] = combined['Team']
-            combined.rename(columns={'Team': 'Team Name'}, inplace=True)
-            
-            final_df = combined[['Season', 'Player Name', 'League Level', 'Team Name', 'Team Org']]
-            final_df = final_df.groupby(['Season', 'Player Name', 'League Level'], as_index=False).agg({
-                'Team Name': lambda x: ', '.join(sorted(set(x.dropna().astype(str)))),
-                'Team Org': lambda x: ', '.join(sorted(set(x.dropna().astype(str))))
-            })
-            final_df.sort_values(by='Player Name', inplace=True)
-            final_df.to_csv(output_file, index=False)
+        jobs.append((name, args))
+        stage_files[name] = files
+
+    results, errors = run_groups(process_npb_year, jobs, "NPB processing")
+    record_processed(results, stage_files)
+    return results, errors
 
 # Load to MySQL
 def load_csv_to_table(file_path, table_name, engine, add_id=False):
     if not os.path.exists(file_path): return
     
     try:
-        try:
-            df = pd.read_csv(file_path)
-        except UnicodeDecodeError:
-            df = pd.read_csv(file_path, encoding='latin1')
+        df = read_processed(file_path)
+        count_rows(rows_in=len(df))
             
         # Normalize columns for MiLB/NPB tables
         if 'Season' in df.columns:
@@ -259,48 +435,310 @@ def load_csv_to_table(file_path, table_name, engine, add_id=False):
                 'Team Name': 'team_name',
                 'Team Org': 'team_org'
             }, inplace=True)
-            
-        df.to_sql(table_name, con=engine, if_exists='replace', index=False)
-        
-        if add_id:
-            with engine.connect() as conn:
-                conn.execute(text(f"ALTER TABLE `{table_name}` ADD COLUMN `id` INT AUTO_INCREMENT PRIMARY KEY FIRST;"))
-                conn.commit()
+            # Indexed key the gap checkers match on, instead of normalizing every row when they read it
+            df['name_key'] = normalize_names(df['player_name'])
+            rows = bulk_load_frame(engine, df, table_name, add_id=add_id, index_columns=['name_key'], column_types=NAME_KEY_TYPES)
+        else:
+            rows = bulk_load_frame(engine, df, table_name, add_id=add_id)
+        count_rows(rows_out=rows)
+        return rows
     except Exception as e:
         print(f"Error loading {table_name}: {e}")
+        return None
+
+def load_if_changed(file_path, table_name, engine, schema, existing_tables, add_id=False):
+    # Reload a table only when its source file changed since the last load (or the table is gone)
+    manifest = get_manifest()
+    key = f"load:{schema}.{table_name}"
+    if table_name in existing_tables and manifest.is_current(key, [file_path]):
+        return False
+
+    with stage(f"load {schema}.{table_name}"):
+        rows = load_csv_to_table(file_path, table_name, engine, add_id=add_id)
+    if rows is None:
+        manifest.forget(key)
+    else:
+        manifest.record(key, [file_path], rows=rows)
+        print(f"Loaded {rows} rows into {schema}.{table_name}")
+    return True
+
+def load_player_seasons_file(engine, league, file_path, created=False):
+    # Replace one processed file's rows in player_seasons, unless it is unchanged since the last load
+    manifest = get_manifest()
+    source = os.path.splitext(os.path.basename(file_path))[0].lower()
+    key = f"load:baseball_db.player_seasons:{source}"
+    if not created and manifest.is_current(key, [file_path]):
+        return
+    try:
+        with stage(f"load player_seasons {source}"):
+            df = read_processed(file_path)
+            rows = replace_player_seasons_source(engine, df, league, source)
+            count_rows(rows_in=len(df), rows_out=rows)
+        manifest.record(key, [file_path], rows=rows)
+        print(f"Loaded {rows} rows from {source} into baseball_db.player_seasons")
+    except Exception as e:
+        print(f"Error loading {source} into player_seasons: {e}")
+        manifest.forget(key)
+
+def load_player_seasons(engine):
+    # All MiLB and NPB processed files into the single, season-partitioned player_seasons table
+    if not engine:
+        return
+    created = create_player_seasons(engine)
+
+    for league, directory in (('MiLB', MILB_PROCESSED_DIR), ('NPB', NPB_PROCESSED_DIR)):
+        for stem, file_path in list_processed(directory).items():
+            load_player_seasons_file(engine, league, file_path, created)
+    get_manifest().save()
 
 def load_data_to_mysql():
+    manifest = get_manifest()
     
     # Load Lahman Data (baseball_db)
     engine_main = get_engine('baseball_db')
     if engine_main:
-        load_csv_to_table(os.path.join(DATA_DIR, 'People.csv'), 'people', engine_main)
-        load_csv_to_table(os.path.join(DATA_DIR, 'Appearances.csv'), 'appearances', engine_main)
+        existing_tables = set(inspect(engine_main).get_table_names())
+        for table in LAHMAN_TABLES:
+            load_if_changed(os.path.join(DATA_DIR, f'{table}.csv'), table.lower(), engine_main, 'baseball_db', existing_tables)
+        manifest.save()
     
+    if LOAD_LAYOUT in ('consolidated', 'both'):
+        load_player_seasons(engine_main)
+        if LOAD_LAYOUT == 'consolidated':
+            return
+
     # Load MiLB Data (milb schema)
     engine_milb = get_engine('milb')
     if engine_milb:
-        files = [f for f in os.listdir(MILB_PROCESSED_DIR) if f.endswith('.csv')]
-        for f in files:
-            table_name = os.path.splitext(f)[0].lower()
-            load_csv_to_table(os.path.join(MILB_PROCESSED_DIR, f), table_name, engine_milb, add_id=True)
+        existing_tables = set(inspect(engine_milb).get_table_names())
+        for stem, file_path in list_processed(MILB_PROCESSED_DIR).items():
+            load_if_changed(file_path, stem.lower(), engine_milb, 'milb', existing_tables, add_id=True)
+        manifest.save()
             
     # Load NPB Data (npb schema)
     engine_npb = get_engine('npb')
     if engine_npb:
-        files = [f for f in os.listdir(NPB_PROCESSED_DIR) if f.endswith('.csv')]
-        for f in files:
-            table_name = os.path.splitext(f)[0].lower()
-            load_csv_to_table(os.path.join(NPB_PROCESSED_DIR, f), table_name, engine_npb, add_id=True)
+        existing_tables = set(inspect(engine_npb).get_table_names())
+        for stem, file_path in list_processed(NPB_PROCESSED_DIR).items():
+            load_if_changed(file_path, stem.lower(), engine_npb, 'npb', existing_tables, add_id=True)
+        manifest.save()
 
+# Streaming pipeline
+PROCESS_FUNCS = {'MiLB': process_milb_group, 'NPB': process_npb_year}
+LEAGUE_SCHEMAS = {'MiLB': 'milb', 'NPB': 'npb'}
 
-def main():
+def stream_lahman(load_queue):
     download_lahman_data()
-    download_milb_data()
-    download_npb_data()
-    process_milb_data()
-    process_npb_data()
-    load_data_to_mysql()
+    for table in LAHMAN_TABLES:
+        load_queue.put(('Lahman', os.path.join(DATA_DIR, f'{table}.csv')))
+
+def stream_downloads(process_queue, leagues):
+    # Downloads every league's files through one download_all call, so they share the downloader's
+    # DOWNLOAD_WORKERS threads and connection pool, and queues each group as soon as its last file is in.
+    # leagues: [(league, jobs, group_key, groups, make_job)], groups being {group: [raw file, ...]} already
+    # on disk; a full queue blocks here until processing catches up.
+    pending = {}
+    owners = {}
+    for league, jobs, group_key, groups, make_job in leagues:
+        for url, dest_path in jobs:
+            group = group_key(os.path.basename(dest_path))
+            if group is not None:
+                pending.setdefault((league, group), set()).add(dest_path)
+                owners[dest_path] = (league, group, groups, make_job)
+                groups.setdefault(group, [])
+                if dest_path not in groups[group]:
+                    groups[group].append(dest_path)
+
+    def enqueue(league, group, groups, make_job):
+        file_paths = [path for path in groups[group] if os.path.exists(path)]
+        if file_paths:
+            process_queue.put((league,) + make_job(group, file_paths))
+
+    def on_complete(dest_path, status):
+        if dest_path in owners:
+            league, group, groups, make_job = owners[dest_path]
+            pending[(league, group)].discard(dest_path)
+            if not pending[(league, group)]:
+                enqueue(league, group, groups, make_job)
+
+    try:
+        jobs = [job for league in leagues for job in league[1]]
+        for league, league_jobs, *_ in leagues:
+            print(f"Checking {len(league_jobs)} {league} files...")
+        get_downloader().download_all(jobs, revalidate=DOWNLOAD_REVALIDATE, on_complete=on_complete)
+        # Groups that are only on disk, e.g. when the file list could not be fetched
+        for league, _, _, groups, make_job in leagues:
+            for group in sorted(groups):
+                if (league, group) not in pending:
+                    enqueue(league, group, groups, make_job)
+    except Exception as e:
+        print(f"Error downloading {', '.join(league[0] for league in leagues)} data: {e}")
+    finally:
+        process_queue.put(None)
+
+def milb_stream():
+    ensure_dir(MILB_RAW_DIR)
+    ensure_dir(MILB_PROCESSED_DIR)
+    jobs = [(link, os.path.join(MILB_RAW_DIR, link.split("/")[-1])) for link in get_milb_links(MILB_RELEASE_URL)]
+    return ('MiLB', jobs, milb_group_key, milb_groups_on_disk(),
+            lambda group, file_paths: milb_job(group[0], group[1], file_paths))
+
+def npb_stream():
+    ensure_dir(NPB_RAW_DIR)
+    ensure_dir(NPB_PROCESSED_DIR)
+    groups = {}
+    for f in os.listdir(NPB_RAW_DIR):
+        year = npb_year(f)
+        if year is not None:
+            groups.setdefault(year, []).append(os.path.join(NPB_RAW_DIR, f))
+    return ('NPB', npb_download_jobs(), npb_year, groups, lambda year, file_paths: npb_job(year))
+
+def stream_leagues(process_queue):
+    try:
+        leagues = [npb_stream(), milb_stream()]
+    except Exception as e:
+        print(f"Error listing league files: {e}")
+        process_queue.put(None)
+        return
+    stream_downloads(process_queue, leagues)
+
+def stream_processing(process_queue, load_queue, producers):
+    # Takes groups off process_queue as they arrive, keeps at most PROCESS_WORKERS of them in flight
+    # and passes each processed file on to load_queue. Returns (results, errors) like run_groups.
+    manifest = get_manifest()
+    workers = max(PROCESS_WORKERS, 1)
+    executor = process_pool(workers) if PROCESS_WORKERS > 1 else None
+    results = {}
+    errors = {}
+    in_flight = {}
+    finished_producers = 0
+
+    def finish(league, name, files, run):
+        try:
+            results[name] = run()
+            count_rows(rows_in=results[name][0], rows_out=results[name][1])
+        except Exception as e:
+            errors[name] = str(e)
+            return
+        key, inputs, outputs = files
+        if all(os.path.exists(path) for path in outputs):
+            manifest.record(key, inputs, outputs)
+            load_queue.put((league, outputs[0]))
+
+    try:
+        while finished_producers < producers or in_flight:
+            for future in [f for f in in_flight if f.done()]:
+                league, name, args, files = in_flight.pop(future)
+                finish(league, name, files, future.result)
+
+            if in_flight and (len(in_flight) >= workers or finished_producers == producers):
+                wait(in_flight, timeout=1, return_when=FIRST_COMPLETED)
+                continue
+            try:
+                item = process_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is None:
+                finished_producers += 1
+                continue
+
+            league, name, args, files = item
+            if manifest.is_current(*files):
+                # Unchanged since last run; the loader still decides whether the table is current
+                load_queue.put((league, files[2][0]))
+            elif executor:
+                in_flight[executor.submit(PROCESS_FUNCS[league], *args)] = item
+            else:
+                finish(league, name, files, lambda: PROCESS_FUNCS[league](*args))
+    finally:
+        if executor:
+            executor.shutdown()
+
+    manifest.save()
+    print(f"Processing: {len(results)} groups processed, {sum(r[1] for r in results.values())} rows written, {len(errors)} errors")
+    for name in sorted(errors):
+        print(f"  Error processing {name}: {errors[name]}")
+    return results, errors
+
+def stream_loading(load_queue):
+    # Loads each processed file (and the Lahman tables) as it comes off load_queue, one at a time
+    manifest = get_manifest()
+    engines = {'baseball_db': get_engine('baseball_db')}
+    if LOAD_LAYOUT != 'consolidated':
+        engines.update(milb=get_engine('milb'), npb=get_engine('npb'))
+    try:
+        existing_tables = {schema: set(inspect(engine).get_table_names()) for schema, engine in engines.items() if engine}
+        consolidated = LOAD_LAYOUT in ('consolidated', 'both') and engines['baseball_db'] is not None
+        created = create_player_seasons(engines['baseball_db']) if consolidated else False
+    except Exception as e:
+        # Keep draining the queue so the stages upstream are not blocked forever
+        print(f"Error connecting to the database, nothing will be loaded: {e}")
+        engines = {}
+        consolidated = False
+
+    while True:
+        item = load_queue.get()
+        if item is None:
+            break
+        if not engines:
+            continue
+        league, file_path = item
+        try:
+            if league == 'Lahman':
+                if engines.get('baseball_db'):
+                    table = os.path.splitext(os.path.basename(file_path))[0].lower()
+                    load_if_changed(file_path, table, engines['baseball_db'], 'baseball_db', existing_tables['baseball_db'])
+            else:
+                if consolidated:
+                    load_player_seasons_file(engines['baseball_db'], league, file_path, created)
+                schema = LEAGUE_SCHEMAS[league]
+                if engines.get(schema):
+                    table = os.path.splitext(os.path.basename(file_path))[0].lower()
+                    load_if_changed(file_path, table, engines[schema], schema, existing_tables[schema], add_id=True)
+            manifest.save()
+        except Exception as e:
+            print(f"Error loading {file_path}: {e}")
+
+def run_streaming_pipeline():
+    # download -> process -> load, connected by bounded queues so all three stages run at once
+    get_manifest()
+    get_downloader()
+    process_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    load_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    loader = threading.Thread(target=stream_loading, args=(load_queue,), name='loader')
+    lahman = threading.Thread(target=stream_lahman, args=(load_queue,), name='lahman')
+    producers = [threading.Thread(target=stream_leagues, args=(process_queue,), name='downloads')]
+    for thread in [loader, lahman] + producers:
+        thread.start()
+
+    try:
+        results, errors = stream_processing(process_queue, load_queue, len(producers))
+    finally:
+        while any(thread.is_alive() for thread in producers):
+            try:
+                process_queue.get(timeout=0.2) # only left over if processing stopped early
+            except queue.Empty:
+                pass
+        lahman.join()
+        load_queue.put(None)
+        loader.join()
+    get_downloader().save_validators()
+    return results, errors
+
+def main():
+    with instrumented_run('etl_pipeline'):
+        if PIPELINE_MODE == 'streaming':
+            with stage('streaming'):
+                run_streaming_pipeline()
+            print("\nPipeline Complete")
+            return
+
+        for name, step in (('download_lahman', download_lahman_data), ('download_milb', download_milb_data),
+                           ('download_npb', download_npb_data), ('process_milb', process_milb_data),
+                           ('process_npb', process_npb_data), ('load', load_data_to_mysql)):
+            with stage(name):
+                step()
     print("\nPipeline Complete")
 
 if __name__ == "__main__":
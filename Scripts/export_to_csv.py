@@ -1,11 +1,26 @@
+import argparse
+import gzip
 import pandas as pd
 import os
-from sqlalchemy import create_engine
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import create_engine, inspect, text
 import db_config
+from manifest import Manifest
+from gap_engine import RESULTS_TABLE, RESULT_COLUMNS
+from instrumentation import instrumented_run, stage, count_rows
 
 DB_NAME = 'baseball_db'
 OUTPUT_DIR = 'Results'
 
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', '4'))
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '50000'))
+EXPORT_CONSOLIDATED_FORMAT = os.getenv('EXPORT_CONSOLIDATED_FORMAT', 'csv.gz') # or 'parquet' (needs pyarrow)
+CONSOLIDATED_NAME = 'players_returning_after_gap_all'
+YEAR_TABLE_PATTERN = re.compile(r'players_returning_after_gap_(\d{4})$')
+INTEGER_COLUMNS = ['id', 'last_seen_year', 'return_year', 'gap_years']
+INTERNAL_COLUMNS = ['name_key'] # matching key, not part of the exported results
+
 def export_tables_to_csv():
     engine = db_config.get_engine(DB_NAME)
     
@@ -19,10 +34,13 @@ def export_tables_to_csv():
         
         print(f"Exporting {full_table_name}...")
         try:
-            df = pd.read_sql(f"SELECT * FROM {full_table_name}", con=engine)
-            
-            output_file = os.path.join(OUTPUT_DIR, f"{table_name}.csv")
-            df.to_csv(output_file, index=False)
+            with stage(f"export {table_name}"):
+                df = pd.read_sql(f"SELECT * FROM {full_table_name}", con=engine)
+                df = df.drop(columns=INTERNAL_COLUMNS, errors='ignore')
+                
+                output_file = os.path.join(OUTPUT_DIR, f"{table_name}.csv")
+                df.to_csv(output_file, index=False)
+                count_rows(rows_in=len(df), rows_out=len(df))
             print(f"Saved to {output_file}")
         except Exception as e:
             print(f"Error exporting {full_table_name}: {e}")
@@ -38,6 +56,222 @@ def export_tables_to_csv():
     except Exception as e:
         print(f"Error exporting {full_summary_name}: {e}")
 
+# Streaming export
+def discover_tables(engine):
+    # {year: name} for every per-year table or view, found with one catalog lookup
+    inspector = inspect(engine)
+    names = inspector.get_table_names(schema='yearly_results') + inspector.get_view_names(schema='yearly_results')
+    tables = {}
+    for name in names:
+        match = YEAR_TABLE_PATTERN.match(name)
+        if match:
+            tables[int(match.group(1))] = name
+    return tables, set(names)
+
+def row_signature_sql():
+    return f"COUNT(*), SUM(CRC32(CONCAT_WS('|', {', '.join(RESULT_COLUMNS)})))"
+
+def table_signatures(engine, tables, names):
+    # {year: 'rows:checksum'}, computed in the database so nothing is read just to find out it did not change.
+    # Per-year views on the long returning_players table get all their signatures from one grouped query.
+    signatures = {}
+    with engine.connect() as conn:
+        if RESULTS_TABLE in names:
+            sql = f"SELECT return_year, {row_signature_sql()} FROM yearly_results.{RESULTS_TABLE} GROUP BY return_year"
+            long_table = {row[0]: f"{row[1]}:{row[2]}" for row in conn.execute(text(sql))}
+            views = set(inspect(conn).get_view_names(schema='yearly_results'))
+            for year, name in tables.items():
+                if name in views:
+                    signatures[year] = long_table.get(year, '0:None')
+
+        for year, name in tables.items():
+            if year in signatures:
+                continue
+            try:
+                count, checksum = conn.execute(text(f"SELECT {row_signature_sql()} FROM yearly_results.{name}")).one()
+                signatures[year] = f"{count}:{checksum}"
+            except Exception as e:
+                print(f"Could not checksum {name}, it will be exported: {e}")
+                conn.rollback()
+    return signatures
+
+def stream_table_to_csv(engine, table_name, output_file):
+    # Reads the table in chunks over a server-side cursor and appends each chunk to the CSV
+    part_file = output_file + '.part'
+    rows = 0
+    with engine.connect().execution_options(stream_results=True, max_row_buffer=EXPORT_CHUNK_SIZE) as conn:
+        chunks = pd.read_sql(text(f"SELECT * FROM yearly_results.{table_name}"), conn, chunksize=EXPORT_CHUNK_SIZE)
+        with open(part_file, 'w', newline='') as f:
+            for i, chunk in enumerate(chunks):
+                chunk = chunk.drop(columns=INTERNAL_COLUMNS, errors='ignore')
+                chunk.to_csv(f, index=False, header=(i == 0))
+                rows += len(chunk)
+    os.replace(part_file, output_file)
+    return rows
+
+def export_year(engine, manifest, table_name, signature):
+    output_file = os.path.join(OUTPUT_DIR, f"{table_name}.csv")
+    key = f"export:{table_name}"
+    if signature and manifest.details(key).get('signature') == signature and manifest.is_current(key, [], [output_file]):
+        return None
+    rows = stream_table_to_csv(engine, table_name, output_file)
+    manifest.record(key, [], [output_file], signature=signature, rows=rows)
+    return rows
+
+def read_year_csvs(files):
+    # (year, chunk) for every per-year CSV, a chunk at a time
+    for year, path in files:
+        dtypes = {c: 'Int64' for c in INTEGER_COLUMNS}
+        for chunk in pd.read_csv(path, chunksize=EXPORT_CHUNK_SIZE, dtype=dtypes):
+            chunk.insert(0, 'year', year)
+            yield year, chunk
+
+def write_consolidated(files, output_file):
+    # One file with a year column, built from the per-year CSVs without holding more than a chunk
+    part_file = output_file + '.part'
+    rows = 0
+    if output_file.endswith('.parquet'):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        schema = None
+        try:
+            for year, chunk in read_year_csvs(files):
+                for c in chunk.columns:
+                    if c not in INTEGER_COLUMNS and c != 'year':
+                        chunk[c] = chunk[c].astype('string')
+                table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = pq.ParquetWriter(part_file, schema)
+                writer.write_table(table)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            return 0
+    else:
+        with gzip.open(part_file, 'wt', newline='') as f:
+            header = True
+            for year, chunk in read_year_csvs(files):
+                chunk.to_csv(f, index=False, header=header)
+                header = False
+                rows += len(chunk)
+    os.replace(part_file, output_file)
+    return rows
+
+def write_if_changed(csv_text, output_file):
+    # Leaves files whose content is unchanged alone, like the database export does
+    if os.path.exists(output_file):
+        with open(output_file, newline='') as f:
+            if f.read() == csv_text:
+                return False
+    with open(output_file, 'w', newline='') as f:
+        f.write(csv_text)
+    return True
+
+def with_year_ids(df_year):
+    # A year's rows numbered 1..n in gap_years DESC order, the ids of the per-year tables and views
+    df_year = df_year.sort_values(['gap_years', 'id'], ascending=[False, True])
+    return df_year.assign(id=range(1, len(df_year) + 1))
+
+def export_frame(df_players, start_year, end_year, df_counts=None):
+    # Export straight from the returning_players frame held in memory (run_pipeline.py), with no database reads
+    manifest = Manifest(os.path.join('Data', 'manifest.json'))
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+        print(f"Created directory: {OUTPUT_DIR}")
+
+    columns = [c for c in RESULT_COLUMNS if c in df_players.columns]
+    by_year = dict(iter(df_players.groupby('return_year')))
+    files = []
+    written = 0
+    with stage('per-year csv'):
+        for year in range(start_year, end_year):
+            output_file = os.path.join(OUTPUT_DIR, f"players_returning_after_gap_{year}.csv")
+            df_year = with_year_ids(by_year.get(year, df_players.iloc[0:0]))
+            if write_if_changed(df_year[columns].to_csv(index=False), output_file):
+                written += 1
+                count_rows(rows_out=len(df_year))
+            files.append((year, output_file))
+    print(f"Exported {written} tables, {len(files) - written} unchanged.")
+
+    consolidated_file = os.path.join(OUTPUT_DIR, f"{CONSOLIDATED_NAME}.{EXPORT_CONSOLIDATED_FORMAT}")
+    key = f"export:{os.path.basename(consolidated_file)}"
+    inputs = [path for year, path in files]
+    if not manifest.is_current(key, inputs, [consolidated_file]):
+        with stage('consolidated'):
+            rows = write_consolidated(files, consolidated_file)
+        manifest.record(key, inputs, [consolidated_file], rows=rows)
+        manifest.save()
+        print(f"Saved {rows} rows to {consolidated_file}")
+
+    if df_counts is not None:
+        write_if_changed(df_counts.to_csv(index=False), os.path.join(OUTPUT_DIR, 'returning_player_counts.csv'))
+
+def export_results():
+    engine = db_config.get_engine(DB_NAME)
+    manifest = Manifest(os.path.join('Data', 'manifest.json'))
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+        print(f"Created directory: {OUTPUT_DIR}")
+
+    with stage('discover'):
+        tables, names = discover_tables(engine)
+        signatures = table_signatures(engine, tables, names)
+    print(f"Found {len(tables)} per-year result tables.")
+
+    exported = {}
+    errors = {}
+    with stage('per-year csv'):
+        with ThreadPoolExecutor(max_workers=EXPORT_WORKERS) as executor:
+            futures = {executor.submit(export_year, engine, manifest, tables[year], signatures.get(year)): year for year in sorted(tables)}
+            for future in as_completed(futures):
+                year = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    errors[year] = str(e)
+                    continue
+                if rows is not None:
+                    exported[year] = rows
+                    count_rows(rows_out=rows)
+        manifest.save()
+    print(f"Exported {len(exported)} tables ({sum(exported.values())} rows), {len(tables) - len(exported) - len(errors)} unchanged, {len(errors)} errors.")
+    for year in sorted(errors):
+        print(f"  Error exporting {tables[year]}: {errors[year]}")
+
+    files = [(year, os.path.join(OUTPUT_DIR, f"{tables[year]}.csv")) for year in sorted(tables)]
+    files = [(year, path) for year, path in files if os.path.exists(path)]
+    consolidated_file = os.path.join(OUTPUT_DIR, f"{CONSOLIDATED_NAME}.{EXPORT_CONSOLIDATED_FORMAT}")
+    key = f"export:{os.path.basename(consolidated_file)}"
+    inputs = [path for year, path in files]
+    if manifest.is_current(key, inputs, [consolidated_file]):
+        print(f"{consolidated_file} is up to date.")
+    else:
+        with stage('consolidated'):
+            rows = write_consolidated(files, consolidated_file)
+            count_rows(rows_out=rows)
+        manifest.record(key, inputs, [consolidated_file], rows=rows)
+        manifest.save()
+        print(f"Saved {rows} rows to {consolidated_file}")
+
+    summary_table = 'returning_player_counts'
+    if summary_table in names:
+        with stage(f"export {summary_table}"):
+            rows = stream_table_to_csv(engine, summary_table, os.path.join(OUTPUT_DIR, f"{summary_table}.csv"))
+            count_rows(rows_out=rows)
+
 
 if __name__ == "__main__":
-    export_tables_to_csv()
+    parser = argparse.ArgumentParser(description="Export the yearly result tables to Results/.")
+    parser.add_argument('--mode', choices=['stream', 'legacy'], default='stream',
+                        help="'stream' exports changed tables in parallel chunks plus one consolidated file; 'legacy' reads every year in turn")
+    args = parser.parse_args()
+
+    with instrumented_run('export_to_csv'):
+        if args.mode == 'stream':
+            export_results()
+        else:
+            export_tables_to_csv()
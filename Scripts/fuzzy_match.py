@@ -0,0 +1,111 @@
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from functools import lru_cache
+
+FUZZY_THRESHOLD = float(os.getenv('FUZZY_THRESHOLD', '0.88'))
+
+NAME_SUFFIXES = {'jr', 'sr', 'ii', 'iii', 'iv', 'v'}
+
+@lru_cache(maxsize=None)
+def fold_name(name):
+    # "José A. Martínez Jr." -> ('jose', 'martinez'): no accents, punctuation, suffixes or middle initials
+    if not isinstance(name, str):
+        return ()
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(c for c in name if not unicodedata.combining(c)).lower()
+    tokens = [t for t in re.split(r"[\s.,'\-]+", name) if t and t not in NAME_SUFFIXES]
+    if len(tokens) > 2:
+        tokens = [tokens[0]] + [t for t in tokens[1:-1] if len(t) > 1] + [tokens[-1]]
+    return tuple(tokens)
+
+@lru_cache(maxsize=None)
+def soundex(word):
+    codes = {}
+    for letters, digit in (('bfpv', '1'), ('cgjkqsxz', '2'), ('dt', '3'), ('l', '4'), ('mn', '5'), ('r', '6')):
+        for letter in letters:
+            codes[letter] = digit
+
+    word = ''.join(c for c in word.lower() if c.isalpha())
+    if not word:
+        return ''
+    result = word[0].upper()
+    previous = codes.get(word[0], '')
+    for c in word[1:]:
+        digit = codes.get(c, '')
+        if digit and digit != previous:
+            result += digit
+        if c not in 'hw': # h and w do not separate letters with the same code
+            previous = digit
+    return (result + '000')[:4]
+
+def block_key(tokens):
+    # Phonetic key of the last name, so romanization variants (Ohtani / Otani) share a block
+    return soundex(tokens[-1]) if tokens else ''
+
+def similarity(a, b):
+    if a == b:
+        return 1.0
+    return SequenceMatcher(None, ' '.join(a), ' '.join(b)).ratio()
+
+@lru_cache(maxsize=1 << 18)
+def score_at_least(a, b, threshold):
+    # similarity(a, b) when it is at or above threshold, else None. The length bound and quick_ratio are
+    # upper bounds of ratio(), so most pairs are ruled out without the full comparison. Cached, since the
+    # same MLB and league names meet again in every season they share.
+    if a == b:
+        return 1.0
+    left, right = ' '.join(a), ' '.join(b)
+    if 2 * min(len(left), len(right)) / (len(left) + len(right)) < threshold:
+        return None
+    matcher = SequenceMatcher(None, left, right)
+    if matcher.quick_ratio() < threshold:
+        return None
+    score = matcher.ratio()
+    return score if score >= threshold else None
+
+class FuzzyIndex:
+    # Blocking index over a gap-engine name index: {(block_key, season): [(folded_name, row), ...]}.
+    # A player is only scored against the names in their own block for each season.
+    def __init__(self, name_index):
+        self.blocks = {}
+        self.season_blocks = {} # {season: block keys with a candidate that season}
+        for (_, year), rows in name_index.items():
+            for res in rows:
+                folded = fold_name(res[0])
+                key = block_key(folded)
+                self.blocks.setdefault((key, year), []).append((folded, res))
+                self.season_blocks.setdefault(year, set()).add(key)
+
+    @staticmethod
+    def name_block(full_name):
+        return block_key(fold_name(full_name))
+
+    def match(self, full_name, years, threshold=None):
+        # [(year, row, score), ...] for every candidate scoring at or above the threshold
+        threshold = FUZZY_THRESHOLD if threshold is None else threshold
+        folded = fold_name(full_name)
+        key = block_key(folded)
+
+        matches = []
+        for y in years:
+            for candidate, res in self.blocks.get((key, y), []):
+                score = score_at_least(folded, candidate, threshold)
+                if score is not None:
+                    matches.append((y, res, score))
+        return matches
+
+    def match_block(self, full_names, key, year, threshold=None):
+        # full_names: names that share block key `key`. [(position in full_names, row, score), ...] for every
+        # pair of one of them and a candidate of that block and year at or above the threshold
+        threshold = FUZZY_THRESHOLD if threshold is None else threshold
+        candidates = self.blocks.get((key, year), [])
+        matches = []
+        for i, full_name in enumerate(full_names):
+            folded = fold_name(full_name)
+            for candidate, res in candidates:
+                score = score_at_least(folded, candidate, threshold)
+                if score is not None:
+                    matches.append((i, res, score))
+        return matches
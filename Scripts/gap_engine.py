@@ -0,0 +1,496 @@
+import argparse
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from sqlalchemy import text, inspect
+import db_config
+from manifest import Manifest
+from processed_io import processed_files_by_year, read_processed
+from names import normalize_names, full_name_keys
+from player_seasons import query_player_seasons
+from gap_writer import write_gap_details
+from crosswalk import (CROSSWALK_COLUMNS, create_crosswalk, crosswalk_seasons, replace_crosswalk_season,
+                       delete_crosswalk_season, gap_crosswalk_rows, namesake_ids)
+from fuzzy_match import FuzzyIndex
+from instrumentation import instrumented_run, stage, count_rows
+
+DB_NAME = 'yearly_results'
+MATCH_METHOD = os.getenv('MATCH_METHOD', 'exact') # 'fuzzy' also matches accents, suffixes, middle initials and romanization variants
+GAP_DETAILS_SOURCE = os.getenv('GAP_DETAILS_SOURCE', 'match') # 'crosswalk' joins result tables with baseball_db.player_crosswalk instead
+# Result tables (and return-year ranges of the long table) checked in parallel; each worker process has its own pooled engine
+GAP_WORKERS = int(os.getenv('GAP_WORKERS', '1'))
+GAP_PARTITIONS_PER_WORKER = int(os.getenv('GAP_PARTITIONS_PER_WORKER', '4'))
+
+def add_to_name_index(name_index, year, name_keys, rows):
+    for name_key, res in zip(name_keys, rows):
+        name_index.setdefault((name_key, year), []).append(tuple(res))
+
+RESULTS_TABLE = 'returning_players' # long results table of the window mode, one row per returning player season
+RESULT_COLUMNS = ['id', 'nameFirst', 'nameLast', 'playerID', 'last_seen_year', 'return_year', 'gap_years', 'gap_years_range', 'gap_details']
+
+def list_result_tables(engine):
+    # Per-year result tables, plus the long returning_players table written by the window mode.
+    # Per-year views on the long table are not listed: updating the long table updates them.
+    tables = inspect(engine).get_table_names()
+    result_tables = sorted(t for t in tables if t.startswith('players_returning_after_gap_'))
+    if RESULTS_TABLE in tables:
+        result_tables.append(RESULTS_TABLE)
+    return result_tables
+
+class LeagueSource:
+    # One league the gap years are checked against. The name index maps
+    # (normalized_name, season) -> [(player_name, level, team, ...), ...] and can be built from
+    # the per-season MySQL tables ('mysql'), the consolidated player_seasons table
+    # ('player_seasons') or the processed files ('files').
+    def __init__(self, name, schema, columns, player_seasons_columns, detail_format,
+                 processed_dir=None, processed_columns=None, exclude_namesakes=False, source='mysql', match_method=None):
+        self.name = name
+        self.schema = schema
+        self.columns = columns
+        self.player_seasons_columns = player_seasons_columns
+        self.detail_format = detail_format
+        self.processed_dir = processed_dir
+        self.processed_columns = processed_columns
+        self.exclude_namesakes = exclude_namesakes # skip players with a same-named player in an MLB year
+        self.source = source
+        self.match_method = match_method or MATCH_METHOD
+        self.name_index = None
+        self.fuzzy_index = None
+
+    def tables_by_year(self, engine):
+        # {2007: ['milb.`milb_2007_aaa`', ...], ...} from table names like milb_YYYY_level
+        tables_raw = inspect(engine).get_table_names(schema=self.schema)
+
+        tables_by_year = {}
+        for t in tables_raw:
+            parts = t.split('_')
+            if len(parts) >= 2 and parts[1].isdigit():
+                tables_by_year.setdefault(int(parts[1]), []).append(f"{self.schema}.`{t}`")
+        return tables_by_year
+
+    def tables_with_name_key(self, engine):
+        # Season tables loaded before the ETL stored name_key get their keys computed on read
+        columns = inspect(engine).get_multi_columns(schema=self.schema)
+        return {f"{self.schema}.`{t}`" for (_, t), cols in columns.items() if any(c['name'] == 'name_key' for c in cols)}
+
+    def prepare(self, engine):
+        # Read every season of this league once, unless lookups go to player_seasons
+        print(f"Building {self.name} name index from {self.source}...")
+        self.name_index = {}
+        if self.source == 'files':
+            for year, paths in processed_files_by_year(self.processed_dir).items():
+                for path in paths:
+                    df = read_processed(path, columns=self.processed_columns)
+                    df = df.astype(object).where(df.notna(), None)
+                    add_to_name_index(self.name_index, year, normalize_names(df[self.processed_columns[0]]),
+                                      df.itertuples(index=False, name=None))
+        elif self.source == 'mysql':
+            keyed_tables = self.tables_with_name_key(engine)
+            with engine.connect() as conn:
+                for year, tables in self.tables_by_year(engine).items():
+                    for table in tables:
+                        if table in keyed_tables:
+                            rows = conn.execute(text(f"SELECT name_key, {', '.join(self.columns)} FROM {table}")).fetchall()
+                            add_to_name_index(self.name_index, year, [r[0] for r in rows], [r[1:] for r in rows])
+                        else:
+                            df = pd.read_sql(text(f"SELECT {', '.join(self.columns)} FROM {table}"), conn)
+                            df = df.astype(object).where(df.notna(), None)
+                            add_to_name_index(self.name_index, year, normalize_names(df[self.columns[0]]),
+                                              df.itertuples(index=False, name=None))
+        elif self.match_method == 'fuzzy':
+            # Fuzzy candidates are not limited to exact name_keys, so read the whole league once
+            self.name_index = self.player_seasons_index(engine, None)
+
+        if self.match_method == 'fuzzy':
+            self.fuzzy_index = FuzzyIndex(self.name_index)
+
+    def player_seasons_index(self, engine, name_keys):
+        name_index = {}
+        with engine.connect() as conn:
+            for season, name_key, *res in query_player_seasons(conn, self.name, name_keys, columns=('name_key',) + self.player_seasons_columns):
+                add_to_name_index(name_index, season, [name_key], [res])
+        return name_index
+
+    def index_for(self, engine, name_keys):
+        if self.source != 'player_seasons' or self.match_method == 'fuzzy':
+            return self.name_index
+        # One indexed query against player_seasons for just the players of one result table
+        return self.player_seasons_index(engine, name_keys)
+
+    def league_index(self, engine):
+        # The whole league's name index, whatever the source
+        if self.name_index is None:
+            self.prepare(engine)
+        if self.source == 'player_seasons' and self.match_method != 'fuzzy':
+            return self.player_seasons_index(engine, None)
+        return self.name_index
+
+    def season_keys(self, engine):
+        # Every (normalized_name, season) this league has a player for
+        if self.source == 'player_seasons':
+            with engine.connect() as conn:
+                return {(name_key, season) for season, name_key in query_player_seasons(conn, self.name, None, columns=('name_key',))}
+        if self.name_index is None:
+            self.prepare(engine)
+        return set(self.name_index)
+
+    def find_matches(self, name_index, first_name, last_name, name_key, years):
+        # [(year, row, score), ...]; exact matches always score 1.0
+        if self.match_method == 'fuzzy':
+            return self.fuzzy_index.match(f"{first_name} {last_name}", years)
+
+        # Equality on the stored name_key, with the same prefilter as the old LIKE '%<last>' query
+        last_suffix = str(last_name).lower()
+
+        matches = []
+        for y in years:
+            for res in name_index.get((name_key, y), []):
+                if str(res[0]).lower().endswith(last_suffix):
+                    matches.append((y, res, 1.0))
+        return matches
+
+    def crosswalk_season(self, people, people_blocks, season, entries):
+        # people: playerID, nameFirst, nameLast, name_key of every MLB player; people_blocks: see people_by_block.
+        # entries: [(name_key, row), ...] of one season, in index order. Returns CROSSWALK_COLUMNS rows.
+        if self.match_method == 'fuzzy':
+            # Each block's players are scored against that block's candidates of the season only
+            matches = []
+            for key in self.fuzzy_index.season_blocks.get(season, ()):
+                block = people_blocks.get(key)
+                if not block:
+                    continue
+                for i, res, score in self.fuzzy_index.match_block([name for _, _, name in block], key, season):
+                    matches.append((block[i][0], block[i][1], res, score))
+            matches.sort(key=lambda match: match[0]) # people order, as one match() per player gave
+            df = pd.DataFrame([match[1:] for match in matches], columns=['playerID', 'res', 'score'])
+        else:
+            candidates = pd.DataFrame({
+                'name_key': [name_key for name_key, res in entries],
+                'res': [res for name_key, res in entries],
+                'order': range(len(entries))
+            })
+            df = candidates.merge(people, on='name_key').sort_values(['order', 'playerID'])
+            # Same prefilter as find_matches
+            keep = [str(res[0]).lower().endswith(str(last_name).lower()) for res, last_name in zip(df['res'], df['nameLast'])]
+            df = df[pd.Series(keep, index=df.index, dtype=bool)].assign(score=1.0)
+
+        res = df['res'].tolist()
+        return pd.DataFrame({
+            'playerID': df['playerID'].tolist(),
+            'league': self.name,
+            'season': season,
+            'player_name': [r[0] for r in res],
+            'level': [r[1] for r in res],
+            'team': [r[2] for r in res],
+            'org': [r[3] if len(r) > 3 else None for r in res],
+            'match_method': self.match_method,
+            'score': df['score'].tolist()
+        }, columns=CROSSWALK_COLUMNS)
+
+    def gap_details(self, name_index, row):
+        first_name = row['nameFirst']
+        last_name = row['nameLast']
+        last_seen = row['last_seen_year']
+        return_year = row['return_year']
+        name_key = row['name_key']
+
+        if self.exclude_namesakes and self.find_matches(name_index, first_name, last_name, name_key, [last_seen, return_year]):
+            return []
+
+        gap_years = range(last_seen + 1, return_year)
+        details = []
+        for y, res, score in self.find_matches(name_index, first_name, last_name, name_key, gap_years):
+            detail = self.detail_format.format(year=y, *res)
+            if score < 1.0:
+                detail += f" (match {score:.2f})"
+            details.append(detail)
+        return details
+
+MILB = LeagueSource(
+    'MiLB', 'milb',
+    columns=('player_name', 'league_level', 'team_name', 'team_org'),
+    player_seasons_columns=('player_name', 'level', 'team', 'org'),
+    detail_format="{year} - {1}, {2}, {3}", # Format: 2007 - AAA, Richmond Braves, Atlanta Braves
+    processed_dir=os.path.join('Data', 'MiLB_Yearly'),
+    processed_columns=['Player Name', 'League Level', 'Team Name', 'Team Org'],
+    source=os.getenv('MILB_SOURCE', 'mysql')
+)
+
+NPB = LeagueSource(
+    'NPB', 'npb',
+    columns=('player_name', 'league_level', 'team_name'),
+    player_seasons_columns=('player_name', 'level', 'team'),
+    detail_format="{year} - {1}, {2}",
+    processed_dir=os.path.join('Data', 'NPB_Yearly'),
+    processed_columns=['Player Name', 'League Level', 'Team Name'],
+    exclude_namesakes=True,
+    source=os.getenv('NPB_SOURCE', 'mysql')
+)
+
+LEAGUE_SOURCES = [MILB, NPB]
+SOURCES_BY_NAME = {source.name: source for source in LEAGUE_SOURCES}
+
+def resolve_table(engine, table, sources, df=None, append=False):
+    # Returns [(id, gap_details), ...] for the rows of one result table whose gap_details change
+    if df is None:
+        df = pd.read_sql_table(table, engine)
+    if df.empty:
+        return []
+
+    if 'name_key' not in df.columns:
+        df = df.assign(name_key=full_name_keys(df['nameFirst'], df['nameLast']))
+    name_keys = set(df['name_key'])
+    indexes = [(source, source.index_for(engine, name_keys)) for source in sources]
+
+    updates = []
+    for row in df.to_dict('records'):
+        player_id = row.get('id') # Primary key
+        if not player_id:
+            continue
+
+        gap_details_list = []
+        for source, name_index in indexes:
+            gap_details_list.extend(source.gap_details(name_index, row))
+
+        new_details = combine_details(row.get('gap_details'), gap_details_list, append)
+        if new_details is not False:
+            updates.append((player_id, new_details))
+    return updates
+
+def combine_details(current_details, gap_details_list, append):
+    # The new gap_details value, or False when it would not change
+    if pd.isna(current_details):
+        current_details = None
+
+    if append:
+        # Entries already there (e.g. from an earlier run of the same checker) are not added again
+        existing = current_details.split("; ") if current_details else []
+        new_entries = [d for d in gap_details_list if d not in existing]
+        if not new_entries:
+            return False
+        new_details = "; ".join(existing + new_entries)
+    else:
+        new_details = "; ".join(gap_details_list) or None
+
+    return new_details if new_details != current_details else False
+
+def resolve_table_from_crosswalk(engine, table, sources, df=None, append=False):
+    # Same updates as resolve_table, from a join with player_crosswalk instead of matching names again
+    if df is None:
+        df = pd.read_sql_table(table, engine)
+    if df.empty:
+        return []
+
+    years = (int(df['return_year'].min()), int(df['return_year'].max()))
+    matches = gap_crosswalk_rows(engine, table, years)
+    details = {}
+    for source in sources:
+        league_matches = matches[matches['league'] == source.name]
+        if source.exclude_namesakes:
+            league_matches = league_matches[~league_matches['id'].isin(namesake_ids(engine, table, source.name, years))]
+        for row_id, season, player_name, level, team, org, score in zip(
+                league_matches['id'], league_matches['season'], league_matches['player_name'], league_matches['level'],
+                league_matches['team'], league_matches['org'], league_matches['score']):
+            detail = source.detail_format.format(player_name, level, team, org, year=int(season))
+            if score < 1.0:
+                detail += f" (match {score:.2f})"
+            details.setdefault(row_id, []).append(detail)
+
+    updates = []
+    for player_id, current_details in zip(df['id'], df['gap_details']):
+        if not player_id:
+            continue
+        new_details = combine_details(current_details, details.get(player_id, []), append)
+        if new_details is not False:
+            updates.append((player_id, new_details))
+    return updates
+
+def crosswalk_signature(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(repr(part).encode('utf-8'))
+    return digest.hexdigest()
+
+def people_by_block(people):
+    # {fuzzy block key: [(position, playerID, "first last"), ...]}, keyed like FuzzyIndex on the same string it folds
+    blocks = {}
+    for position, (player_id, first_name, last_name) in enumerate(zip(people['playerID'], people['nameFirst'], people['nameLast'])):
+        full_name = f"{first_name} {last_name}"
+        blocks.setdefault(FuzzyIndex.name_block(full_name), []).append((position, player_id, full_name))
+    return blocks
+
+def update_crosswalk(sources=None):
+    # Match every MLB player against each league season and store the matches in player_crosswalk.
+    # A season is only re-matched when its player-seasons, the people table or the match method changed.
+    sources = LEAGUE_SOURCES if sources is None else sources
+    engine = db_config.get_engine(DB_NAME)
+    manifest = Manifest(os.path.join('Data', 'manifest.json'))
+    created = create_crosswalk(engine)
+
+    people = pd.read_sql("SELECT playerID, nameFirst, nameLast FROM baseball_db.people", engine)
+    people['name_key'] = full_name_keys(people['nameFirst'], people['nameLast'])
+    people_signature = crosswalk_signature(people.sort_values('playerID').values.tolist())
+    people_blocks = people_by_block(people) if any(source.match_method == 'fuzzy' for source in sources) else {}
+
+    for source in sources:
+        with stage(f"crosswalk {source.name}"):
+            seasons = {}
+            for (name_key, season), rows in source.league_index(engine).items():
+                seasons.setdefault(season, []).extend((name_key, res) for res in rows)
+
+            matched = 0
+            for season in sorted(seasons):
+                key = f"crosswalk:{source.name}:{season}"
+                signature = crosswalk_signature(people_signature, source.match_method, seasons[season])
+                if not created and manifest.details(key).get('signature') == signature:
+                    continue
+                rows = replace_crosswalk_season(engine, source.name, season, source.crosswalk_season(people, people_blocks, season, seasons[season]))
+                manifest.record(key, [], signature=signature, rows=rows)
+                count_rows(rows_in=len(seasons[season]), rows_out=rows)
+                matched += 1
+
+            # Seasons that are gone from the league
+            for season in crosswalk_seasons(engine, source.name) - set(seasons):
+                delete_crosswalk_season(engine, source.name, season)
+                manifest.forget(f"crosswalk:{source.name}:{season}")
+        manifest.save()
+        print(f"{source.name} crosswalk: {matched} seasons matched, {len(seasons) - matched} unchanged.")
+
+def apply_updates(df, updates):
+    # Mirror the rows written to the database in a result frame held in memory
+    if updates:
+        details = dict(updates)
+        changed = df['id'].isin(details.keys())
+        df.loc[changed, 'gap_details'] = df.loc[changed, 'id'].map(details)
+
+def check_gaps(sources=None, append=False, frames=None, use_crosswalk=None):
+    # Resolve every league for every returning player in one pass over each result table.
+    # By default gap_details is replaced with the combined details of all sources; append=True
+    # adds to what is already there (the behaviour of running the checkers one after another).
+    # frames: {table: DataFrame} of result tables already in memory; they are used instead of
+    # reading the tables back and are kept in step with what is written.
+    # use_crosswalk: read the matches from player_crosswalk (see update_crosswalk) instead of matching names.
+    sources = LEAGUE_SOURCES if sources is None else sources
+    engine = db_config.get_engine(DB_NAME)
+    if use_crosswalk is None:
+        use_crosswalk = GAP_DETAILS_SOURCE == 'crosswalk'
+    resolve = resolve_table_from_crosswalk if use_crosswalk else resolve_table
+
+    if frames is None:
+        frames = {table: None for table in list_result_tables(engine)}
+
+    if GAP_WORKERS > 1:
+        check_partitions(engine, frames, sources, append, use_crosswalk)
+        return
+
+    if not use_crosswalk:
+        for source in sources:
+            with stage(f"prepare {source.name}"):
+                source.prepare(engine)
+                count_rows(rows_in=sum(len(rows) for rows in source.name_index.values()))
+
+    for table, df in frames.items():
+        with stage(f"check {table}"):
+            if df is None:
+                df = pd.read_sql_table(table, engine)
+            count_rows(rows_in=len(df))
+            updates = resolve(engine, table, sources, df=df, append=append)
+            updates_made = write_gap_details(engine, table, updates)
+            apply_updates(df, updates)
+            count_rows(rows_out=updates_made)
+        if updates_made > 0:
+            print(f"  Updated {updates_made} players in {table}.")
+
+def year_ranges(years, parts):
+    # Contiguous (first, last) return-year ranges of roughly equal size
+    years = sorted(years)
+    size = max(1, -(-len(years) // parts))
+    return [(years[i], years[min(i + size, len(years)) - 1]) for i in range(0, len(years), size)]
+
+def read_partition(engine, table, years):
+    if years is None:
+        return pd.read_sql_table(table, engine)
+    sql = text(f"SELECT * FROM {table} WHERE return_year BETWEEN :first AND :last ORDER BY id")
+    return pd.read_sql(sql, engine, params={'first': years[0], 'last': years[1]})
+
+def partition_units(engine, frames, parts):
+    # [(table, years, df), ...]: every per-year table is one unit; the long table is split by return year
+    units = []
+    for table, df in frames.items():
+        if table != RESULTS_TABLE:
+            units.append((table, None, df))
+            continue
+        if df is None:
+            with engine.connect() as conn:
+                years = [row[0] for row in conn.execute(text(f"SELECT DISTINCT return_year FROM {table}"))]
+        else:
+            years = df['return_year'].unique().tolist()
+        for first, last in year_ranges(years, parts):
+            part = None if df is None else df[df['return_year'].between(first, last)]
+            units.append((table, (first, last), part))
+    return units
+
+def check_partition(table, years, source_names, append, use_crosswalk, df=None):
+    # Runs in a worker process: resolve and write one unit with the worker's own engine
+    engine = db_config.get_engine(DB_NAME)
+    sources = [SOURCES_BY_NAME[name] for name in source_names]
+    if not use_crosswalk:
+        for source in sources:
+            # Built once per worker and kept for the other units it runs
+            if source.name_index is None:
+                source.prepare(engine)
+    if df is None:
+        df = read_partition(engine, table, years)
+    resolve = resolve_table_from_crosswalk if use_crosswalk else resolve_table
+    updates = resolve(engine, table, sources, df=df, append=append)
+    return len(df), write_gap_details(engine, table, updates), updates
+
+def check_partitions(engine, frames, sources, append, use_crosswalk):
+    # Parallel check_gaps: units run on GAP_WORKERS processes; progress and errors are collected here
+    units = partition_units(engine, frames, GAP_WORKERS * GAP_PARTITIONS_PER_WORKER)
+    source_names = [source.name for source in sources]
+    # Workers come from a forkserver (spawn where there is none), not a fork of this process: a fork taken
+    # while the instrumentation sampler holds the run's lock would deadlock on the worker's first statement
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    context = multiprocessing.get_context(method)
+    print(f"Checking {len(units)} partitions on {GAP_WORKERS} workers...")
+
+    errors = {}
+    updated = 0
+    with stage('check partitions'):
+        with ProcessPoolExecutor(max_workers=GAP_WORKERS, mp_context=context) as executor:
+            futures = {executor.submit(check_partition, table, years, source_names, append, use_crosswalk, df): (table, years)
+                       for table, years, df in units}
+            for done, future in enumerate(as_completed(futures), 1):
+                table, years = futures[future]
+                label = table if years is None else f"{table} {years[0]}-{years[1]}"
+                try:
+                    rows_in, updates_made, updates = future.result()
+                except Exception as e:
+                    errors[label] = str(e)
+                    print(f"  [{done}/{len(units)}] {label}: error")
+                    continue
+                updated += updates_made
+                count_rows(rows_in=rows_in, rows_out=updates_made)
+                if frames.get(table) is not None:
+                    apply_updates(frames[table], updates)
+                if updates_made > 0:
+                    print(f"  [{done}/{len(units)}] Updated {updates_made} players in {label}.")
+
+    print(f"Gap check: {len(units) - len(errors)} partitions checked, {updated} players updated, {len(errors)} errors")
+    for label in sorted(errors):
+        print(f"  Error checking {label}: {errors[label]}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fill gap_details for every result table from MiLB and NPB.")
+    parser.add_argument('--update-crosswalk', action='store_true',
+                        help="Bring baseball_db.player_crosswalk up to date, then fill gap_details from it")
+    args = parser.parse_args()
+
+    with instrumented_run('gap_engine'):
+        if args.update_crosswalk:
+            with stage('crosswalk'):
+                update_crosswalk()
+        check_gaps(use_crosswalk=True if args.update_crosswalk else None)
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+import db_config
+from names import full_name_keys
+from gap_engine import MILB, NPB
+
+FIRST_YEAR = 1871
+LAST_YEAR = 2025
+DEFAULT_PATH = os.path.join('Data', 'gap_index')
+
+class GapIndex:
+    # One bitset per player and league: bit y is set when the player has a season in year FIRST_YEAR + y.
+    # MLB seasons come from appearances; MiLB and NPB seasons are any same-named player-season in that
+    # league (the exact normalized-name match the gap checkers use, without the NPB namesake rule).
+    # Every return to MLB is derived once, so queries are boolean masks over a few arrays.
+
+    def __init__(self, player_ids, first_names, last_names, bits, first_year=FIRST_YEAR):
+        self.player_ids = player_ids
+        self.first_names = first_names
+        self.last_names = last_names
+        self.bits = bits # {league: packed uint8 array, players x ceil(years / 8)}
+        self.first_year = first_year
+        self.years = len(bits['mlb'][0]) * 8 if len(bits['mlb']) else 0
+        self._seasons = {}
+        self._returns = None
+
+    @classmethod
+    def build(cls, engine=None, first_year=FIRST_YEAR, last_year=LAST_YEAR):
+        engine = engine or db_config.get_engine('baseball_db')
+        seasons = pd.read_sql(
+            "SELECT DISTINCT a.playerID, a.yearID, p.nameFirst, p.nameLast FROM appearances a LEFT JOIN people p ON a.playerID = p.playerID",
+            con=engine)
+        seasons = seasons[(seasons['yearID'] >= first_year) & (seasons['yearID'] <= last_year)]
+        players = seasons.drop_duplicates('playerID').sort_values('playerID').reset_index(drop=True)
+        index_of = pd.Series(np.arange(len(players)), index=players['playerID'])
+        shape = (len(players), last_year - first_year + 1)
+
+        mlb = np.zeros(shape, dtype=bool)
+        mlb[index_of[seasons['playerID']].values, (seasons['yearID'] - first_year).values] = True
+        bits = {'mlb': np.packbits(mlb, axis=1)}
+
+        # Same key as the gap checkers: normalized "first last"
+        name_keys = pd.DataFrame({
+            'name_key': full_name_keys(players['nameFirst'], players['nameLast']).to_numpy(),
+            'player': np.arange(len(players))
+        })
+        for league, source in (('milb', MILB), ('npb', NPB)):
+            keys = pd.DataFrame(list(source.season_keys(engine)), columns=['name_key', 'season'])
+            keys = keys[(keys['season'] >= first_year) & (keys['season'] <= last_year)]
+            hits = keys.merge(name_keys, on='name_key')
+            league_bits = np.zeros(shape, dtype=bool)
+            league_bits[hits['player'].values, (hits['season'] - first_year).astype(int).values] = True
+            bits[league] = np.packbits(league_bits, axis=1)
+
+        return cls(players['playerID'].to_numpy(dtype=str), players['nameFirst'].fillna('').to_numpy(dtype=str),
+                   players['nameLast'].fillna('').to_numpy(dtype=str), bits, first_year)
+
+    def save(self, path=DEFAULT_PATH):
+        # One .npy per array, so load() can memory-map them instead of reading them in
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'player_ids.npy'), self.player_ids)
+        np.save(os.path.join(path, 'first_names.npy'), self.first_names)
+        np.save(os.path.join(path, 'last_names.npy'), self.last_names)
+        for league, packed in self.bits.items():
+            np.save(os.path.join(path, f'{league}.npy'), packed)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'first_year': self.first_year, 'players': len(self.player_ids), 'leagues': list(self.bits)}, f)
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH, mmap=True):
+        mode = 'r' if mmap else None
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        bits = {league: np.load(os.path.join(path, f'{league}.npy'), mmap_mode=mode) for league in meta['leagues']}
+        return cls(np.load(os.path.join(path, 'player_ids.npy'), mmap_mode=mode),
+                   np.load(os.path.join(path, 'first_names.npy'), mmap_mode=mode),
+                   np.load(os.path.join(path, 'last_names.npy'), mmap_mode=mode),
+                   bits, meta['first_year'])
+
+    def seasons(self, league='mlb'):
+        # players x years boolean matrix, unpacked on first use
+        if league not in self._seasons:
+            self._seasons[league] = np.unpackbits(self.bits[league], axis=1, count=self.years).astype(bool)
+        return self._seasons[league]
+
+    def returns(self):
+        # Every return to MLB after a gap: arrays of player index, last_seen_year, return_year, gap_years
+        if self._returns is None:
+            mlb = self.seasons('mlb')
+            year_index = np.arange(mlb.shape[1])
+            # Index of the latest MLB season up to each year (-1 before the first one)
+            last_seen = np.maximum.accumulate(np.where(mlb, year_index, -1), axis=1)
+            previous = np.empty_like(last_seen)
+            previous[:, 0] = -1
+            previous[:, 1:] = last_seen[:, :-1]
+            player, year = np.nonzero(mlb & (previous >= 0) & (year_index - previous > 1))
+            self._returns = {
+                'player': player,
+                'last_seen': previous[player, year],
+                'return': year,
+                'gap': year - previous[player, year] - 1
+            }
+        return self._returns
+
+    def gap_seasons_in(self, league):
+        # Seasons of each return's gap the player spent in the league
+        r = self.returns()
+        counts = np.zeros((self.seasons(league).shape[0], self.years + 1), dtype=np.int32)
+        np.cumsum(self.seasons(league), axis=1, out=counts[:, 1:])
+        # Seasons last_seen+1 .. return-1 are counts[return] - counts[last_seen + 1]
+        return counts[r['player'], r['return']] - counts[r['player'], r['last_seen'] + 1]
+
+    def query(self, min_gap=1, max_gap=None, start_year=None, end_year=None, whole_gap_in=None, any_gap_in=None):
+        # Returns as a DataFrame. start_year/end_year bound the return year (inclusive);
+        # whole_gap_in / any_gap_in take a league ('milb' or 'npb') the gap was spent in.
+        r = self.returns()
+        mask = r['gap'] >= min_gap
+        if max_gap is not None:
+            mask &= r['gap'] <= max_gap
+        if start_year is not None:
+            mask &= r['return'] >= start_year - self.first_year
+        if end_year is not None:
+            mask &= r['return'] <= end_year - self.first_year
+        if whole_gap_in:
+            mask &= self.gap_seasons_in(whole_gap_in) == r['gap']
+        if any_gap_in:
+            mask &= self.gap_seasons_in(any_gap_in) > 0
+
+        player = r['player'][mask]
+        return pd.DataFrame({
+            'playerID': self.player_ids[player],
+            'nameFirst': self.first_names[player],
+            'nameLast': self.last_names[player],
+            'last_seen_year': r['last_seen'][mask] + self.first_year,
+            'return_year': r['return'][mask] + self.first_year,
+            'gap_years': r['gap'][mask]
+        }).sort_values(['return_year', 'gap_years'], ascending=[True, False], ignore_index=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query the in-memory gap index.")
+    parser.add_argument('--build', action='store_true', help="Rebuild the index from the database and save it")
+    parser.add_argument('--path', default=DEFAULT_PATH)
+    parser.add_argument('--min-gap', type=int, default=1)
+    parser.add_argument('--max-gap', type=int)
+    parser.add_argument('--start-year', type=int)
+    parser.add_argument('--end-year', type=int)
+    parser.add_argument('--whole-gap-in', choices=['milb', 'npb'])
+    parser.add_argument('--any-gap-in', choices=['milb', 'npb'])
+    args = parser.parse_args()
+
+    if args.build or not os.path.exists(os.path.join(args.path, 'meta.json')):
+        index = GapIndex.build()
+        index.save(args.path)
+        print(f"Saved gap index for {len(index.player_ids)} players to {args.path}")
+    else:
+        index = GapIndex.load(args.path)
+
+    pd.set_option('display.width', 1000)
+    print(index.query(args.min_gap, args.max_gap, args.start_year, args.end_year, args.whole_gap_in, args.any_gap_in))
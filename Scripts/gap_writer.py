@@ -0,0 +1,29 @@
+from sqlalchemy import text
+
+STAGE_TABLE = 'gap_details_stage'
+
+def write_gap_details(engine, table, updates):
+    # updates: [(id, gap_details), ...]. Staged into a temporary table with bound parameters,
+    # then applied with a single UPDATE ... JOIN, all in one transaction.
+    if not updates:
+        return 0
+    rows = [{'id': int(row_id), 'gap_details': details} for row_id, details in updates]
+
+    with engine.begin() as conn:
+        if conn.dialect.name == 'sqlite':
+            conn.execute(text(f"DROP TABLE IF EXISTS temp.{STAGE_TABLE}"))
+        else:
+            conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {STAGE_TABLE}"))
+        conn.execute(text(f"CREATE TEMPORARY TABLE {STAGE_TABLE} (id INT PRIMARY KEY, gap_details TEXT)"))
+        conn.execute(text(f"INSERT INTO {STAGE_TABLE} (id, gap_details) VALUES (:id, :gap_details)"), rows)
+        if conn.dialect.name == 'sqlite':
+            conn.execute(text(
+                f"UPDATE {table} SET gap_details = s.gap_details FROM {STAGE_TABLE} s WHERE {table}.id = s.id"
+            ))
+            conn.execute(text(f"DROP TABLE temp.{STAGE_TABLE}"))
+        else:
+            conn.execute(text(
+                f"UPDATE {table} t JOIN {STAGE_TABLE} s ON t.id = s.id SET t.gap_details = s.gap_details"
+            ))
+            conn.execute(text(f"DROP TEMPORARY TABLE {STAGE_TABLE}"))
+    return len(rows)
@@ -1,10 +1,45 @@
+import argparse
 import pandas as pd
 import os
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, inspect, bindparam, MetaData, Table
 import db_config
+from bulk_loader import bulk_load_frame, insert_frame, NAME_KEY_TYPES
+from names import full_name_keys
+import gap_engine
+from gap_engine import RESULTS_TABLE, RESULT_COLUMNS
+from instrumentation import instrumented_run, stage, count_rows
 
 DB_NAME = 'baseball_db'
 
+# (player, season, name) rows the results were last computed from; incremental runs diff appearances against it
+SNAPSHOT_TABLE = 'appearances_snapshot'
+SNAPSHOT_QUERY = "SELECT DISTINCT a.playerID, a.yearID, p.nameFirst, p.nameLast FROM appearances a LEFT JOIN people p ON a.playerID = p.playerID"
+ROW_KEY = ['playerID', 'return_year', 'last_seen_year', 'nameFirst', 'nameLast']
+
+def drop_year_views(engine, view_names=None):
+    # Per-year views from the window mode have to go before per-year tables can take their names
+    with engine.connect() as connection:
+        for view_name in inspect(connection).get_view_names(schema='yearly_results'):
+            if view_name.startswith('players_returning_after_gap_') and (view_names is None or view_name in view_names):
+                connection.execute(text(f"DROP VIEW yearly_results.{view_name};"))
+        connection.commit()
+
+def with_name_key(df):
+    # Indexed normalized-name key the gap checkers join on
+    return df.assign(name_key=full_name_keys(df['nameFirst'], df['nameLast']))
+
+def save_year_table(engine, df_result, year):
+    new_table_name = f'players_returning_after_gap_{year}'
+    print(f"\nSaving results to table 'yearly_results.{new_table_name}'...")
+    drop_year_views(engine, [new_table_name])
+
+    # Created with the extra column for manual details and an auto-incrementing Primary Key 'id' at the start of the table
+    df_result = df_result.assign(gap_details=pd.Series(None, index=df_result.index, dtype=object))
+    df_result = with_name_key(df_result)
+    bulk_load_frame(engine, df_result, new_table_name, add_id=True, schema='yearly_results',
+                    index_columns=['name_key'], column_types=NAME_KEY_TYPES)
+    print(f"Added 'gap_details' and Primary Key to {new_table_name}.")
+
 def run_mysql_query(sql_file_path, year):
     engine = db_config.get_engine(DB_NAME)
         
@@ -13,31 +48,162 @@ def run_mysql_query(sql_file_path, year):
         
     sql_query = sql_template.format(year=year)
 
-    df_result = pd.read_sql(sql_query, con=engine)
+    with stage(f"query {year}"):
+        df_result = pd.read_sql(sql_query, con=engine)
+        count_rows(rows_out=len(df_result))
         
     pd.set_option('display.max_columns', None)
     pd.set_option('display.width', 1000)
         
     print(df_result)
 
-    new_table_name = f'players_returning_after_gap_{year}'
-    print(f"\nSaving results to table 'yearly_results.{new_table_name}'...")
-    df_result.to_sql(new_table_name, con=engine, schema='yearly_results', if_exists='replace', index=False)
+    save_year_table(engine, df_result, year)
 
-    # Add the extra column for manual details and a Primary Key
+    print("Done.")
+
+def drop_window_results(engine):
+    # The per-year mode writes only players_returning_after_gap_YYYY tables. A returning_players table
+    # (and its views) left by an earlier window run would go stale and still be checked and exported.
+    drop_year_views(engine)
     with engine.connect() as connection:
-        try:
-            # Add gap_details column
-            connection.execute(text(f"ALTER TABLE yearly_results.{new_table_name} ADD COLUMN gap_details TEXT;"))
-            
-            # Add an auto-incrementing Primary Key 'id' at the start of the table
-            connection.execute(text(f"ALTER TABLE yearly_results.{new_table_name} ADD COLUMN id INT AUTO_INCREMENT PRIMARY KEY FIRST;"))
-            
-            print(f"Added 'gap_details' and Primary Key to {new_table_name}.")
-        except Exception as e:
-            print(f"Could not alter table {new_table_name}: {e}")
+        connection.execute(text(f"DROP TABLE IF EXISTS yearly_results.{RESULTS_TABLE};"))
+        connection.commit()
+
+def run_per_year_queries(sql_file_path, start_year, end_year):
+    engine = db_config.get_engine(DB_NAME)
+    drop_window_results(engine)
+    for year in range(start_year, end_year):
+        print(f"Processing year: {year}")
+        run_mysql_query(sql_file_path, year)
+
+def run_window_query(sql_file_path, start_year, end_year, per_year_output='view'):
+    engine = db_config.get_engine(DB_NAME)
+
+    with open(sql_file_path, 'r') as file:
+        sql_template = file.read()
+
+    # A single LAG() pass over every player's seasons finds all return years at once
+    sql_query = sql_template.format(start_year=start_year, end_year=end_year - 1, player_filter='')
 
+    with stage('window query'):
+        df_result = pd.read_sql(sql_query, con=engine)
+        count_rows(rows_out=len(df_result))
+    print(f"Found {len(df_result)} returning player seasons between {start_year} and {end_year - 1}.")
+
+    df_result['gap_details'] = pd.Series(None, index=df_result.index, dtype=object)
+    df_result = with_name_key(df_result)
+
+    # ids are assigned in return_year, gap_years DESC order, like the per-year tables (rows an
+    # --incremental run adds later get ids after all of these)
+    print(f"\nSaving results to table 'yearly_results.{RESULTS_TABLE}'...")
+    with stage('save results'):
+        bulk_load_frame(engine, df_result, RESULTS_TABLE, add_id=True, schema='yearly_results',
+                        index_columns=['return_year', 'name_key'], column_types=NAME_KEY_TYPES)
+    df_result.insert(0, 'id', range(1, len(df_result) + 1))
+
+    with stage(f"per-year {per_year_output}s"):
+        if per_year_output == 'view':
+            create_year_views(engine, start_year, end_year)
+        elif per_year_output == 'table':
+            for year in range(start_year, end_year):
+                df_year = df_result[df_result['return_year'] == year]
+                save_year_table(engine, df_year.drop(columns=['id', 'gap_details', 'name_key']), year)
+
+    save_snapshot(engine)
     print("Done.")
+    return df_result
+
+def save_snapshot(engine):
+    with engine.connect() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {SNAPSHOT_TABLE};"))
+        connection.execute(text(f"CREATE TABLE {SNAPSHOT_TABLE} AS {SNAPSHOT_QUERY};"))
+        connection.commit()
+
+def affected_players(engine):
+    # Players with a season added or removed, or a changed name, since the snapshot
+    current = pd.read_sql(SNAPSHOT_QUERY, con=engine)
+    snapshot = pd.read_sql(f"SELECT playerID, yearID, nameFirst, nameLast FROM {SNAPSHOT_TABLE}", con=engine)
+    diff = current.merge(snapshot, how='outer', indicator=True)
+    return set(diff.loc[diff['_merge'] != 'both', 'playerID'])
+
+def run_incremental_query(sql_file_path, start_year, end_year):
+    # Recompute returning_players only for players whose appearances changed. Rows that are still
+    # right keep their id and gap_details; rows that no longer hold are deleted; new rows are
+    # inserted and returned (with their ids) so only they need to be matched again.
+    engine = db_config.get_engine(DB_NAME)
+    tables = inspect(engine).get_table_names(schema='yearly_results')
+    if RESULTS_TABLE not in tables or SNAPSHOT_TABLE not in inspect(engine).get_table_names():
+        print("No previous results to update, running the full analysis.")
+        return run_window_query(sql_file_path, start_year, end_year)
+    # Only returning_players is updated, so per-year tables (--per-year-output table) would keep stale rows
+    year_tables = [t for t in tables if t.startswith('players_returning_after_gap_')]
+    if year_tables:
+        raise ValueError(f"{len(year_tables)} per-year result tables exist and would not be updated; "
+                         "run the full analysis instead of --incremental")
+
+    with stage('diff appearances'):
+        players = sorted(affected_players(engine))
+    print(f"{len(players)} players have changed appearances since the last run.")
+    if not players:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    with open(sql_file_path, 'r') as file:
+        sql_template = file.read()
+    sql_query = sql_template.format(start_year=start_year, end_year=end_year - 1, player_filter="WHERE playerID IN :players")
+    players_param = {'players': players}
+
+    with stage('recompute'):
+        new_rows = pd.read_sql(text(sql_query).bindparams(bindparam('players', expanding=True)), con=engine, params=players_param)
+        old_rows = pd.read_sql(text(f"SELECT id, {', '.join(ROW_KEY)} FROM yearly_results.{RESULTS_TABLE} WHERE playerID IN :players")
+                               .bindparams(bindparam('players', expanding=True)), con=engine, params=players_param)
+        merged = old_rows.merge(new_rows, on=ROW_KEY, how='outer', indicator=True)
+        removed_ids = [int(i) for i in merged.loc[merged['_merge'] == 'left_only', 'id']]
+        added = merged.loc[merged['_merge'] == 'right_only', new_rows.columns].reset_index(drop=True)
+        count_rows(rows_in=len(new_rows), rows_out=len(added))
+
+    years = sorted(set(merged.loc[merged['_merge'] != 'both', 'return_year'].astype(int)))
+    print(f"{len(removed_ids)} rows removed and {len(added)} added, in return years {years}.")
+
+    table = Table(RESULTS_TABLE, MetaData(schema='yearly_results'), autoload_with=engine)
+    with engine.begin() as connection:
+        if removed_ids:
+            connection.execute(table.delete().where(table.c.id.in_(removed_ids)))
+        if not added.empty:
+            added_frame = added.assign(gap_details=None)
+            if 'name_key' in table.c: # tables written before name_key existed do not get one
+                added_frame = with_name_key(added_frame)
+            insert_frame(connection, table, added_frame)
+
+    # Read the new rows back for their ids
+    if added.empty:
+        added_rows = pd.DataFrame(columns=RESULT_COLUMNS)
+    else:
+        added_players = {'players': sorted(set(added['playerID']))}
+        stored = pd.read_sql(text(f"SELECT {', '.join(RESULT_COLUMNS)} FROM yearly_results.{RESULTS_TABLE} WHERE playerID IN :players")
+                             .bindparams(bindparam('players', expanding=True)), con=engine, params=added_players)
+        added_rows = stored.merge(added[ROW_KEY], on=ROW_KEY)[RESULT_COLUMNS]
+
+    save_snapshot(engine)
+    print("Done.")
+    return added_rows
+
+def create_year_views(engine, start_year, end_year):
+    # Keep the old players_returning_after_gap_YYYY names working on top of the long table.
+    # Each view numbers its rows 1..n in gap_years DESC order, like the per-year tables, instead of
+    # showing the long table's ids
+    columns = ', '.join(['ROW_NUMBER() OVER (ORDER BY gap_years DESC, id) AS id'] + RESULT_COLUMNS[1:])
+    drop_year_views(engine)
+    with engine.connect() as connection:
+        for year in range(start_year, end_year):
+            view_name = f'players_returning_after_gap_{year}'
+            connection.execute(text(f"DROP TABLE IF EXISTS yearly_results.{view_name};"))
+            if db_config.is_sqlite(engine):
+                # SQLite views may only reference tables in their own database, unqualified
+                connection.execute(text(f"CREATE VIEW yearly_results.{view_name} AS SELECT {columns} FROM {RESULTS_TABLE} WHERE return_year = {year} ORDER BY 1;"))
+            else:
+                connection.execute(text(f"CREATE VIEW yearly_results.{view_name} AS SELECT {columns} FROM yearly_results.{RESULTS_TABLE} WHERE return_year = {year} ORDER BY 1;"))
+        connection.commit()
+    print(f"Created per-year views for {start_year}-{end_year - 1}.")
 
 def run_summary_query(start_year, end_year):
     engine = db_config.get_engine(DB_NAME)
@@ -56,13 +222,57 @@ def run_summary_query(start_year, end_year):
     
     table_name = 'returning_player_counts'
     df_result.to_sql(table_name, con=engine, schema='yearly_results', if_exists='replace', index=False)
-        
+
+def run_grouped_summary_query(start_year, end_year, df_players=None):
+    # df_players: the returning_players frame from run_window_query, counted in memory instead of re-read
+    engine = db_config.get_engine(DB_NAME)
+
+    print("\nGenerating summary table...")
+
+    if df_players is None:
+        sql_query = f"SELECT return_year as year, COUNT(*) as player_count FROM yearly_results.{RESULTS_TABLE} GROUP BY return_year ORDER BY year;"
+        df_result = pd.read_sql(sql_query, con=engine)
+    else:
+        df_result = df_players.groupby('return_year').size().rename_axis('year').reset_index(name='player_count')
+
+    # Years without any returning players still get a row, as with the per-year tables
+    df_result = df_result.set_index('year').reindex(range(start_year, end_year), fill_value=0).rename_axis('year').reset_index()
+    print(df_result)
+
+    table_name = 'returning_player_counts'
+    df_result.to_sql(table_name, con=engine, schema='yearly_results', if_exists='replace', index=False)
+    return df_result
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find MLB players who returned after a gap of one or more seasons.")
+    parser.add_argument('--mode', choices=['window', 'per-year'], default='window',
+                        help="'window' finds every return year in one query; 'per-year' runs the original query once per year")
+    parser.add_argument('--per-year-output', choices=['view', 'table', 'none'], default='view',
+                        help="How window mode exposes the players_returning_after_gap_YYYY names")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Window mode only: recompute and re-match just the players whose appearances changed since the last run")
+    args = parser.parse_args()
+
     start_year = 1871
     end_year = 2025
     
-    for year in range(start_year, end_year):
-        print(f"Processing year: {year}")
-        run_mysql_query('SQL/returning_players.sql', year)
+    with instrumented_run('identify_returning_players'):
+        if args.incremental:
+            with stage('identify'):
+                df_added = run_incremental_query('SQL/returning_players_window.sql', start_year, end_year)
+            if not df_added.empty:
+                with stage('gaps'):
+                    gap_engine.check_gaps(frames={RESULTS_TABLE: df_added})
+            with stage('summary'):
+                run_grouped_summary_query(start_year, end_year)
+        elif args.mode == 'window':
+            with stage('identify'):
+                run_window_query('SQL/returning_players_window.sql', start_year, end_year, args.per_year_output)
+            with stage('summary'):
+                run_grouped_summary_query(start_year, end_year)
+        else:
+            with stage('identify'):
+                run_per_year_queries('SQL/returning_players.sql', start_year, end_year)
 
-    run_summary_query(start_year, end_year)
\ No newline at end of file
+            with stage('summary'):
+                run_summary_query(start_year, end_year)
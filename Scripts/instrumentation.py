@@ -0,0 +1,213 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Per-stage wall time, rows, bytes downloaded, SQL statements and memory, written as one JSON report per run
+INSTRUMENT = os.getenv('INSTRUMENT', '1') == '1'
+INSTRUMENT_REPORT_DIR = os.getenv('INSTRUMENT_REPORT_DIR', os.path.join('Data', 'reports'))
+INSTRUMENT_PROGRESS = os.getenv('INSTRUMENT_PROGRESS', '0') == '1' # live progress line on stderr
+SAMPLE_INTERVAL = 0.5
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+class Stage:
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.path = f"{parent.path} > {name}" if parent else name
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.rows_in = 0
+        self.rows_out = 0
+        self.bytes_downloaded = 0
+        self.statements = 0
+        self.round_trips = 0
+        self.sql_seconds = 0.0
+        self.peak_rss_mb = current_rss_mb()
+        self.error = None
+        self.children = []
+
+    def sample(self, rss):
+        if rss is not None and (self.peak_rss_mb is None or rss > self.peak_rss_mb):
+            self.peak_rss_mb = rss
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'seconds': round(self.seconds if self.seconds is not None else time.perf_counter() - self.started, 4),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'bytes_downloaded': self.bytes_downloaded,
+            'statements': self.statements,
+            'round_trips': self.round_trips,
+            'sql_seconds': round(self.sql_seconds, 4),
+            'peak_rss_mb': round(self.peak_rss_mb, 1) if self.peak_rss_mb is not None else None,
+            'error': self.error,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+class Run:
+    # Stages nest; counters are added to every open stage, so a parent's totals include its sub-steps.
+    # Download threads add to whatever stages are open when they report.
+    def __init__(self, name):
+        self.name = name
+        self.started_at = datetime.now()
+        self.root = Stage(name)
+        self.open = [self.root]
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample, daemon=True)
+        self.sampler.start()
+
+    def _sample(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            rss = current_rss_mb()
+            with self.lock:
+                for stage in self.open:
+                    stage.sample(rss)
+                if INSTRUMENT_PROGRESS:
+                    self._progress(rss)
+
+    def _progress(self, rss):
+        stage = self.open[-1]
+        line = (f"[{stage.path}] {time.perf_counter() - stage.started:.1f}s rows {stage.rows_in}/{stage.rows_out} "
+                f"sql {stage.statements} dl {stage.bytes_downloaded / (1024 * 1024):.1f}MB")
+        if rss is not None:
+            line += f" rss {rss:.0f}MB"
+        sys.stderr.write('\r' + line[:150].ljust(150))
+        sys.stderr.flush()
+
+    def add(self, **counts):
+        with self.lock:
+            for stage in self.open:
+                for key, value in counts.items():
+                    setattr(stage, key, getattr(stage, key) + value)
+
+    def push(self, name):
+        with self.lock:
+            stage = Stage(name, self.open[-1])
+            self.open[-1].children.append(stage)
+            self.open.append(stage)
+        return stage
+
+    def pop(self, stage):
+        rss = current_rss_mb()
+        with self.lock:
+            stage.seconds = time.perf_counter() - stage.started
+            stage.sample(rss)
+            if stage.peak_rss_mb is None:
+                stage.peak_rss_mb = peak_rss_mb()
+            self.open.remove(stage)
+
+    def report(self):
+        self.stopped.set()
+        self.pop(self.root)
+        if INSTRUMENT_PROGRESS:
+            sys.stderr.write('\n')
+        return {
+            'run': self.name,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'process_peak_rss_mb': round(peak_rss_mb(), 1) if peak_rss_mb() is not None else None,
+            'stages': self.root.to_dict()
+        }
+
+_run = None
+
+class _NullStage:
+    # Stand-in when no run is active, so library code can open stages unconditionally
+    rows_in = rows_out = 0
+
+_NULL_STAGE = _NullStage()
+
+@contextmanager
+def stage(name):
+    run = _run
+    if run is None:
+        yield _NULL_STAGE
+        return
+    current = run.push(name)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        run.pop(current)
+
+@contextmanager
+def instrumented_run(name):
+    # Wraps a script's main(); a run inside another run is just a stage of the outer one
+    global _run
+    if not INSTRUMENT or _run is not None:
+        with stage(name) as current:
+            yield current
+        return
+
+    _run = Run(name)
+    try:
+        yield _run.root
+    except BaseException as e:
+        _run.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        run, _run = _run, None
+        write_report(run.report(), name)
+
+def write_report(report, name):
+    try:
+        if not os.path.exists(INSTRUMENT_REPORT_DIR):
+            os.makedirs(INSTRUMENT_REPORT_DIR)
+        path = os.path.join(INSTRUMENT_REPORT_DIR, f"{name}_{datetime.now():%Y%m%d_%H%M%S}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Run report written to {path}")
+    except OSError as e:
+        print(f"Could not write run report: {e}")
+
+def count_rows(rows_in=0, rows_out=0):
+    if _run is not None:
+        _run.add(rows_in=rows_in, rows_out=rows_out)
+
+def count_bytes(n):
+    if _run is not None:
+        _run.add(bytes_downloaded=n)
+
+def instrument_engine(engine):
+    # Count statements (each parameter set of an executemany) and round trips to the server
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('instrument_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['instrument_started'].pop()
+        if _run is not None:
+            statements = len(parameters) if executemany and parameters else 1
+            _run.add(statements=statements, round_trips=1, sql_seconds=time.perf_counter() - started)
+
+    @event.listens_for(engine, 'handle_error')
+    def on_error(context):
+        if context.connection is not None and context.connection.info.get('instrument_started'):
+            context.connection.info['instrument_started'].pop()
+
+    return engine
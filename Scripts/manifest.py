@@ -0,0 +1,74 @@
+import os
+import json
+import hashlib
+import threading
+
+class Manifest:
+    # Records size, mtime and sha256 of every file the ETL touches, and the inputs each
+    # stage output was built from, so a stage only reruns when one of its inputs changed.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {'files': {}, 'stages': {}}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.data = json.load(f)
+            self.data.setdefault('files', {})
+            self.data.setdefault('stages', {})
+
+    def file_hash(self, path):
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.data['files'].get(path)
+        # Only re-hash a file when its size or mtime moved
+        if cached and cached['size'] == stat.st_size and cached['mtime'] == stat.st_mtime:
+            return cached['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        with self.lock:
+            self.data['files'][path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def input_hashes(self, inputs):
+        return {path: self.file_hash(path) for path in sorted(inputs)}
+
+    def is_current(self, key, inputs, outputs=()):
+        with self.lock:
+            entry = self.data['stages'].get(key)
+        if not entry:
+            return False
+        if any(not os.path.exists(path) for path in outputs):
+            return False
+        if any(entry.get('outputs', {}).get(path) != self.file_hash(path) for path in outputs):
+            return False
+        return entry['inputs'] == self.input_hashes(inputs)
+
+    def record(self, key, inputs, outputs=(), **details):
+        entry = {'inputs': self.input_hashes(inputs), 'outputs': self.input_hashes(outputs)}
+        entry.update(details)
+        with self.lock:
+            self.data['stages'][key] = entry
+
+    def details(self, key):
+        # Whatever extra details were recorded with a stage, e.g. rows or a table signature
+        with self.lock:
+            return dict(self.data['stages'].get(key, {}))
+
+    def forget(self, key):
+        with self.lock:
+            self.data['stages'].pop(key, None)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self.lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,45 @@
+import re
+from functools import lru_cache
+
+# Scalar versions are cached for row-at-a-time callers; the *_names / *_keys versions work on whole columns
+# and give the same result for every string.
+NAME_CACHE_SIZE = 1 << 16
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def normalize_name(n): # Remove periods, spaces, and lowercase
+    if not n: return ""
+    return n.replace('.', '').replace(' ', '').lower()
+
+def normalize_names(names):
+    # Series of names -> Series of name_keys; missing names become ""
+    return names.astype(object).fillna('').astype(str).str.replace('.', '', regex=False).str.replace(' ', '', regex=False).str.lower()
+
+def full_name_keys(first_names, last_names):
+    # normalize_name(f"{first} {last}") for whole columns. A missing name is formatted the way the f-string
+    # formats it ('None', 'nan'), so the keys, and what they match, stay those of the row-at-a-time checkers
+    first_names = first_names.astype(object).map(str)
+    last_names = last_names.astype(object).map(str)
+    return normalize_names(first_names + ' ' + last_names)
+
+@lru_cache(maxsize=NAME_CACHE_SIZE)
+def clean_npb_name(html_name):
+    # '<a href="...">Sugano, Tomoyuki</a>' -> 'Tomoyuki Sugano'
+    if not isinstance(html_name, str): return ""
+    name_text = html_name
+    match = re.search(r'>([^<]+)<', html_name)
+    if match: name_text = match.group(1)
+    if ',' in name_text:
+        parts = name_text.split(',')
+        if len(parts) >= 2: return f"{parts[1].strip()} {parts[0].strip()}"
+    return name_text.strip()
+
+def clean_npb_names(html_names):
+    # Vectorized clean_npb_name
+    is_text = html_names.map(lambda n: isinstance(n, str))
+    text = html_names.where(is_text, '').astype(str)
+    text = text.str.extract(r'>([^<]+)<', expand=False).fillna(text)
+    parts = text.str.split(',', n=2, expand=True)
+    if parts.shape[1] < 2:
+        return text.str.strip()
+    swapped = parts[1].str.strip() + ' ' + parts[0].str.strip()
+    return text.str.strip().where(parts[1].isna(), swapped)
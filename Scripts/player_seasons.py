@@ -0,0 +1,81 @@
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, SmallInteger, String, Text, Index, text, bindparam
+from bulk_loader import create_if_missing, insert_frame
+from names import normalize_names
+
+# Every MiLB and NPB player-season in one table, instead of one table per processed file
+PLAYER_SEASONS_SCHEMA = 'baseball_db'
+PLAYER_SEASONS_TABLE = 'player_seasons'
+
+player_seasons = Table(PLAYER_SEASONS_TABLE, MetaData(schema=PLAYER_SEASONS_SCHEMA),
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('season', SmallInteger, nullable=False),
+    Column('league', String(16), nullable=False),
+    Column('level', String(64)),
+    Column('player_name', String(255)),
+    Column('name_key', String(255)),
+    Column('team', Text),
+    Column('org', Text),
+    Column('source', String(64), nullable=False), # processed file the rows came from, e.g. milb_2007_aaa
+    Index('idx_name_key_season', 'name_key', 'season'),
+    Index('idx_source', 'source')
+)
+
+def partition_clause(first_decade=1870, last_decade=2030):
+    partitions = [f"PARTITION p{d} VALUES LESS THAN ({d + 10})" for d in range(first_decade, last_decade + 1, 10)]
+    partitions.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return "PARTITION BY RANGE (season) (\n    " + ",\n    ".join(partitions) + "\n)"
+
+MYSQL_DDL = f"""
+CREATE TABLE {PLAYER_SEASONS_SCHEMA}.{PLAYER_SEASONS_TABLE} (
+    id INT NOT NULL AUTO_INCREMENT,
+    season SMALLINT NOT NULL,
+    league VARCHAR(16) NOT NULL,
+    level VARCHAR(64),
+    player_name VARCHAR(255),
+    name_key VARCHAR(255),
+    team TEXT,
+    org TEXT,
+    source VARCHAR(64) NOT NULL,
+    PRIMARY KEY (id, season),
+    KEY idx_name_key_season (name_key, season),
+    KEY idx_source (source)
+)
+{partition_clause()};
+"""
+
+def create_player_seasons(engine):
+    # Returns True when the table had to be created. On MySQL the table is partitioned on season,
+    # which means the season has to be part of the primary key
+    return create_if_missing(engine, player_seasons, MYSQL_DDL)
+
+def player_seasons_frame(df, league, source):
+    # Processed MiLB/NPB layout -> player_seasons rows
+    return pd.DataFrame({
+        'season': df['Season'].astype(int),
+        'league': league,
+        'level': df['League Level'],
+        'player_name': df['Player Name'],
+        'name_key': normalize_names(df['Player Name']),
+        'team': df['Team Name'],
+        'org': df['Team Org'],
+        'source': source
+    })
+
+def replace_player_seasons_source(engine, df, league, source):
+    rows = player_seasons_frame(df, league, source)
+    with engine.begin() as conn:
+        conn.execute(player_seasons.delete().where(player_seasons.c.source == source))
+        insert_frame(conn, player_seasons, rows)
+    return len(rows)
+
+def query_player_seasons(conn, league, name_keys, columns=('player_name', 'level', 'team', 'org')):
+    # One indexed lookup for a batch of players: [(season, player_name, level, ...), ...].
+    # name_keys=None returns the whole league.
+    select_sql = f"SELECT season, {', '.join(columns)} FROM {PLAYER_SEASONS_SCHEMA}.{PLAYER_SEASONS_TABLE} WHERE league = :league"
+    if name_keys is None:
+        return conn.execute(text(select_sql + " ORDER BY id"), {'league': league}).fetchall()
+    if not name_keys:
+        return []
+    sql = text(select_sql + " AND name_key IN :name_keys ORDER BY id").bindparams(bindparam('name_keys', expanding=True))
+    return conn.execute(sql, {'league': league, 'name_keys': sorted(name_keys)}).fetchall()
@@ -0,0 +1,67 @@
+import os
+import re
+import pandas as pd
+
+# Format of the processed MiLB_Yearly / NPB_Yearly files: csv, parquet or feather.
+# parquet and feather need pyarrow (in requirements.txt).
+PROCESSED_FORMAT = os.getenv('PROCESSED_FORMAT', 'csv')
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# Low-cardinality strings that are stored dictionary-encoded in parquet/feather
+CATEGORY_COLUMNS = ['League Level', 'Team Name', 'Team Org']
+
+def processed_path(directory, stem, fmt=None):
+    return os.path.join(directory, stem + EXTENSIONS[fmt or PROCESSED_FORMAT])
+
+def write_processed(df, path):
+    ext = os.path.splitext(path)[1]
+    if ext == '.csv':
+        df.to_csv(path, index=False)
+        return
+
+    df = df.astype({'Season': 'int32', 'Player Name': 'string'})
+    # Empty strings come back from csv as missing values; store them the same way here
+    for c in CATEGORY_COLUMNS:
+        if c in df.columns:
+            df[c] = df[c].mask(df[c] == '')
+    df = df.astype({c: 'category' for c in CATEGORY_COLUMNS if c in df.columns})
+    if ext == '.parquet':
+        df.to_parquet(path, index=False)
+    elif ext == '.feather':
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        raise ValueError(f"Unknown processed file format: {path}")
+
+def read_processed(path, columns=None):
+    ext = os.path.splitext(path)[1]
+    if ext == '.parquet':
+        return pd.read_parquet(path, columns=columns)
+    if ext == '.feather':
+        return pd.read_feather(path, columns=columns)
+    try:
+        return pd.read_csv(path, usecols=columns)
+    except UnicodeDecodeError:
+        return pd.read_csv(path, usecols=columns, encoding='latin1')
+
+def list_processed(directory):
+    # {stem: path} for every processed file; when a stem exists in several formats the configured one wins
+    files = {}
+    if not os.path.exists(directory):
+        return files
+    preferred = EXTENSIONS[PROCESSED_FORMAT]
+    for f in sorted(os.listdir(directory)):
+        stem, ext = os.path.splitext(f)
+        if ext not in EXTENSIONS.values():
+            continue
+        if stem not in files or ext == preferred:
+            files[stem] = os.path.join(directory, f)
+    return files
+
+def processed_files_by_year(directory):
+    # {2007: ['Data/MiLB_Yearly/MiLB_2007_aaa.parquet', ...], ...} from names like MiLB_YYYY_level / NPB_YYYY
+    by_year = {}
+    for stem, path in list_processed(directory).items():
+        match = re.match(r'[A-Za-z]+_(\d{4})', stem)
+        if match:
+            by_year.setdefault(int(match.group(1)), []).append(path)
+    return by_year
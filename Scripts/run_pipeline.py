@@ -0,0 +1,62 @@
+import argparse
+import db_config
+import etl_pipeline
+import identify_returning_players
+import gap_engine
+import export_to_csv
+from instrumentation import instrumented_run, stage
+
+STAGES = ['etl', 'crosswalk', 'identify', 'gaps', 'export']
+
+def run_pipeline(stages, start_year=1871, end_year=2025, per_year_output='view', incremental=False):
+    # ETL -> crosswalk -> identify -> gap checks -> export in one process. The returning_players frame found by
+    # identify is handed to the gap checks and the export instead of being read back from the database.
+    # With the crosswalk stage, the gap checks join against player_crosswalk instead of matching names.
+    # incremental: identify only recomputes changed players, and only their new rows are matched.
+    df_players = None
+    df_counts = None
+    frames = None
+
+    with instrumented_run('run_pipeline'):
+        if 'etl' in stages:
+            etl_pipeline.main()
+
+        if 'crosswalk' in stages:
+            with stage('crosswalk'):
+                gap_engine.update_crosswalk()
+
+        if 'identify' in stages and incremental:
+            with stage('identify'):
+                df_added = identify_returning_players.run_incremental_query('SQL/returning_players_window.sql', start_year, end_year)
+                identify_returning_players.run_grouped_summary_query(start_year, end_year)
+            frames = {gap_engine.RESULTS_TABLE: df_added}
+        elif 'identify' in stages:
+            with stage('identify'):
+                df_players = identify_returning_players.run_window_query('SQL/returning_players_window.sql', start_year, end_year, per_year_output)
+                df_counts = identify_returning_players.run_grouped_summary_query(start_year, end_year, df_players)
+            frames = {gap_engine.RESULTS_TABLE: df_players}
+
+        if 'gaps' in stages and not (frames and all(df.empty for df in frames.values())):
+            with stage('gaps'):
+                gap_engine.check_gaps(frames=frames, use_crosswalk=True if 'crosswalk' in stages else None)
+
+        if 'export' in stages:
+            with stage('export'):
+                if df_players is not None:
+                    export_to_csv.export_frame(df_players, start_year, end_year, df_counts)
+                else:
+                    export_to_csv.export_results()
+
+    db_config.dispose_engines()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the whole pipeline, or some of its stages, in one process.")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help="Stages to run, in pipeline order (default: all)")
+    parser.add_argument('--per-year-output', choices=['view', 'none'], default='view',
+                        help="How identify exposes the players_returning_after_gap_YYYY names")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only recompute and re-match players whose appearances changed since the last run")
+    args = parser.parse_args()
+
+    run_pipeline(args.stages, per_year_output=args.per_year_output, incremental=args.incremental)
@@ -0,0 +1,206 @@
+import atexit
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+
+# Opt-in per-statement SQL profile: every engine from db_config.get_engine records each statement's normalized
+# text, calls, total and p95 latency and rows. When the process exits, the slowest statements are EXPLAINed
+# and a ranked report is printed and written next to the run reports.
+SQL_PROFILE = os.getenv('SQL_PROFILE', '0') == '1'
+SQL_PROFILE_EXPLAIN = int(os.getenv('SQL_PROFILE_EXPLAIN', '10')) # how many of the slowest statements to EXPLAIN
+SQL_PROFILE_TOP = int(os.getenv('SQL_PROFILE_TOP', '20')) # statements printed in the ranked report
+SQL_PROFILE_REPORT_DIR = os.getenv('SQL_PROFILE_REPORT_DIR', os.getenv('INSTRUMENT_REPORT_DIR', os.path.join('Data', 'reports')))
+
+EXPLAINABLE = ('select', 'with', 'update', 'delete', 'insert')
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+YEAR_IN_NAME = re.compile(r"(?<=_)\d{4}(?=_|\b)") # players_returning_after_gap_2005, milb_2007_aaa
+PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|(?<!:):\w+|\?")
+VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+WHITESPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=4096)
+def normalize_statement(statement):
+    # Literals and bind parameters become ?, IN/VALUES lists collapse, and a year in a table name becomes YYYY,
+    # so the same query against each per-year table or with different values is one entry
+    text = STRING_LITERAL.sub('?', statement)
+    text = YEAR_IN_NAME.sub('YYYY', text)
+    text = NUMBER_LITERAL.sub('?', text)
+    text = PLACEHOLDER.sub('?', text)
+    text = VALUE_LIST.sub('(?, ...)', text)
+    return WHITESPACE.sub(' ', text).strip()
+
+def p95(durations):
+    ordered = sorted(durations)
+    return ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+
+class StatementStats:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+        self.total = 0.0
+        self.durations = []
+        self.rows = 0
+        self.rows_known = False
+        self.slowest = 0.0
+        self.slowest_call = None # (engine, statement, parameters) of the slowest call, for EXPLAIN; one parameter set
+
+    def add(self, seconds, rows, engine, statement, parameters):
+        self.calls += 1
+        self.total += seconds
+        self.durations.append(seconds)
+        if rows is not None and rows >= 0:
+            self.rows += rows
+            self.rows_known = True
+        if seconds >= self.slowest:
+            self.slowest = seconds
+            self.slowest_call = (engine, statement, parameters)
+
+class Profiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.local = threading.local() # local.explaining: this thread is running the profiler's own EXPLAIN
+
+    def record(self, seconds, rows, engine, statement, parameters):
+        text = normalize_statement(statement)
+        with self.lock:
+            stats = self.stats.get(text)
+            if stats is None:
+                stats = self.stats[text] = StatementStats(text)
+            stats.add(seconds, rows, engine, statement, parameters)
+
+    def ranked(self):
+        with self.lock:
+            return sorted(self.stats.values(), key=lambda s: s.total, reverse=True)
+
+    def explain(self, stats):
+        # (plan rows, full scans) for the slowest call of a statement, run on the engine it ran on
+        engine, statement, parameters = stats.slowest_call
+        if not statement.lstrip().lower().startswith(EXPLAINABLE):
+            return None, []
+        sqlite = engine.dialect.name == 'sqlite'
+        prefix = 'EXPLAIN QUERY PLAN ' if sqlite else 'EXPLAIN '
+        self.local.explaining = True
+        try:
+            with engine.connect() as conn:
+                result = conn.exec_driver_sql(prefix + statement, parameters or None)
+                columns = list(result.keys())
+                plan = [dict(zip(columns, row)) for row in result]
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}, []
+        finally:
+            self.local.explaining = False
+        return plan, full_scans(plan, sqlite)
+
+    def report(self):
+        ranked = self.ranked()
+        total = sum(s.total for s in ranked)
+        statements = []
+        for rank, stats in enumerate(ranked, 1):
+            entry = {
+                'rank': rank,
+                'statement': stats.text,
+                'calls': stats.calls,
+                'total_seconds': round(stats.total, 4),
+                'share': round(stats.total / total, 4) if total else None,
+                'mean_ms': round(1000 * stats.total / stats.calls, 3),
+                'p95_ms': round(1000 * p95(stats.durations), 3),
+                'max_ms': round(1000 * stats.slowest, 3),
+                'rows': stats.rows if stats.rows_known else None
+            }
+            if rank <= SQL_PROFILE_EXPLAIN:
+                entry['explain'], entry['full_scans'] = self.explain(stats)
+            statements.append(entry)
+        return {
+            'run': os.path.basename(sys.argv[0]) or 'python',
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'sql_seconds': round(total, 4),
+            'statements': statements
+        }
+
+def full_scans(plan, sqlite):
+    # Tables read without an index, by the dialect's own EXPLAIN format
+    scans = []
+    for step in plan:
+        if sqlite:
+            detail = str(step.get('detail', ''))
+            if detail.startswith('SCAN ') and 'USING' not in detail:
+                scans.append(detail[len('SCAN '):].split(' ')[0])
+        elif str(step.get('type', '')).upper() == 'ALL':
+            scans.append(step.get('table'))
+    return scans
+
+_profiler = None
+_profiler_pid = None
+
+def get_profiler():
+    # One profiler per process; the report is written when the process that created it exits
+    global _profiler, _profiler_pid
+    if _profiler is None or _profiler_pid != os.getpid():
+        _profiler = Profiler()
+        _profiler_pid = os.getpid()
+        atexit.register(write_profile_report, _profiler, _profiler_pid)
+    return _profiler
+
+def profile_engine(engine):
+    from sqlalchemy import event
+    profiler = get_profiler()
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info['profile_started'].pop()
+        if getattr(profiler.local, 'explaining', False):
+            return
+        # rowcount: rows changed, or rows returned where the driver buffers results (pymysql); -1 when unknown
+        rows = getattr(cursor, 'rowcount', None)
+        if executemany: # keep the first parameter set, not the whole batch, for EXPLAIN
+            parameters = parameters[0] if parameters else ()
+        profiler.record(seconds, rows, engine, statement, parameters)
+
+    @event.listens_for(engine, 'handle_error')
+    def on_error(context):
+        if context.connection is not None and context.connection.info.get('profile_started'):
+            context.connection.info['profile_started'].pop()
+
+    return engine
+
+def print_report(report):
+    print(f"\nSQL profile: {len(report['statements'])} distinct statements, {report['sql_seconds']:.2f}s in SQL")
+    print(f"{'#':>3} {'total s':>9} {'share':>6} {'calls':>7} {'mean ms':>9} {'p95 ms':>9} {'rows':>9}  statement")
+    for entry in report['statements'][:SQL_PROFILE_TOP]:
+        share = f"{100 * entry['share']:.1f}%" if entry['share'] is not None else '-'
+        rows = entry['rows'] if entry['rows'] is not None else '-'
+        print(f"{entry['rank']:>3} {entry['total_seconds']:>9.3f} {share:>6} {entry['calls']:>7} {entry['mean_ms']:>9.2f} "
+              f"{entry['p95_ms']:>9.2f} {rows:>9}  {entry['statement'][:100]}")
+        if entry.get('full_scans'):
+            print(f"{'':>3} full scan: {', '.join(str(t) for t in entry['full_scans'])}")
+
+def write_profile_report(profiler, pid):
+    # Worker processes that inherited the profiler leave the report to the process that created it
+    if pid != os.getpid() or not profiler.stats:
+        return
+    report = profiler.report()
+    print_report(report)
+    try:
+        if not os.path.exists(SQL_PROFILE_REPORT_DIR):
+            os.makedirs(SQL_PROFILE_REPORT_DIR)
+        name = os.path.splitext(report['run'])[0]
+        path = os.path.join(SQL_PROFILE_REPORT_DIR, f"sql_profile_{name}_{datetime.now():%Y%m%d_%H%M%S}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"SQL profile written to {path}")
+    except OSError as e:
+        print(f"Could not write SQL profile: {e}")
@@ -0,0 +1,132 @@
+import importlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from downloader import Downloader
+
+PAYLOAD = b'playerID,yearID\n' + b''.join(f'p{i:05d},{1900 + i % 120}\n'.encode() for i in range(5000))
+ETAG = '"v1"'
+
+class StandIn(BaseHTTPRequestHandler):
+    # Serves PAYLOAD at /file.csv with an ETag and Range support. /flaky/<status>/<n> answers
+    # <status> n times before serving the file. Every request is recorded on the server.
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        if self.path.startswith('/flaky/'):
+            _, _, status, times = self.path.split('/')
+            count = self.server.failures.get(self.path, 0)
+            if count < int(times):
+                self.server.failures[self.path] = count + 1
+                self.send_response(int(status))
+                self.send_header('Retry-After', '0')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        elif self.path == '/releases':
+            body = self.server.page.encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        elif self.path != '/file.csv':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.headers.get('If-None-Match') == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = PAYLOAD
+        requested = self.headers.get('Range')
+        if requested:
+            start = int(requested.split('=')[1].rstrip('-'))
+            body = PAYLOAD[start:]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}')
+        else:
+            self.send_response(200)
+        self.send_header('ETag', ETAG)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    httpd.requests = []
+    httpd.failures = {}
+    httpd.page = ''
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f'http://127.0.0.1:{httpd.server_port}'
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+def make_downloader(tmp_path, retries=3):
+    return Downloader(max_workers=2, default_rate=1000, max_retries=retries, backoff=0,
+                      validators_path=str(tmp_path / 'validators.json'))
+
+def test_fetch_stores_validators_and_revalidates_with_304(server, tmp_path):
+    dest = str(tmp_path / 'file.csv')
+    downloader = make_downloader(tmp_path)
+    assert downloader.fetch(f'{server.url}/file.csv', dest) == 'downloaded'
+    with open(dest, 'rb') as f:
+        assert f.read() == PAYLOAD
+    downloader.save_validators()
+
+    # A new downloader picks the ETag up from the validators file and sends it
+    again = make_downloader(tmp_path)
+    assert again.fetch(f'{server.url}/file.csv', dest) == 'not_modified'
+    assert server.requests[-1][1].get('If-None-Match') == ETAG
+    assert not os.path.exists(dest + '.part')
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_request_retries_rate_limits_and_server_errors(server, tmp_path, status):
+    dest = str(tmp_path / 'file.csv')
+    path = f'/flaky/{status}/2'
+    assert make_downloader(tmp_path).fetch(server.url + path, dest) == 'downloaded'
+    assert [p for p, headers in server.requests].count(path) == 3
+    with open(dest, 'rb') as f:
+        assert f.read() == PAYLOAD
+
+def test_request_gives_up_after_max_retries(server, tmp_path):
+    dest = str(tmp_path / 'file.csv')
+    assert make_downloader(tmp_path, retries=1).fetch(f'{server.url}/flaky/503/5', dest) == 'failed'
+    assert len(server.requests) == 2
+    assert not os.path.exists(dest)
+
+def test_fetch_resumable_continues_a_partial_file_with_range(server, tmp_path):
+    dest = str(tmp_path / 'archive.zip')
+    with open(dest + '.part', 'wb') as f:
+        f.write(PAYLOAD[:1000])
+    make_downloader(tmp_path).fetch_resumable(f'{server.url}/file.csv', dest)
+    assert server.requests[-1][1].get('Range') == 'bytes=1000-'
+    with open(dest, 'rb') as f:
+        assert f.read() == PAYLOAD
+    assert not os.path.exists(dest + '.part')
+
+def test_base_url_overrides_reach_every_download_url(server, monkeypatch, tmp_path):
+    monkeypatch.setenv('GITHUB_BASE_URL', server.url + '/')
+    monkeypatch.setenv('NPB_BASE_URL', server.url)
+    import etl_pipeline
+    etl_pipeline = importlib.reload(etl_pipeline)
+    try:
+        assert etl_pipeline.LAHMAN_URL.startswith(server.url + '/chadwickbureau/')
+        assert etl_pipeline.NPB_BATTING_URL_PATTERN.format(year=2020).startswith(server.url + '/wp-content/')
+
+        link = '/armstjc/milb-data-repository/releases/download/game_player_stats/2020_11_aaa_player_game_stats.csv'
+        server.page = f'<a href="{link}">2020</a>'
+        monkeypatch.setattr(etl_pipeline, '_downloader', make_downloader(tmp_path))
+        assert etl_pipeline.get_milb_links(f'{server.url}/releases') == [server.url + link]
+    finally:
+        monkeypatch.delenv('GITHUB_BASE_URL')
+        monkeypatch.delenv('NPB_BASE_URL')
+        importlib.reload(etl_pipeline)
@@ -0,0 +1,184 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+import db_config
+import gap_engine
+import check_milb_gaps
+import check_npb_gaps
+from names import normalize_names, full_name_keys
+
+# (first, last, last_seen_year, return_year) per return year. Each player is a case the matcher has to get right.
+RETURNING = {
+    2006: [
+        ('J.D.', 'Martinez', 2002, 2006), # 'JD Martinez' in MiLB: same normalized name
+        ('Juan', 'De La Cruz', 2003, 2006), # 'Juan Dela Cruz' normalizes the same, but does not end with the last name
+        ('Kenji', 'Tanaka', 2002, 2006), # MiLB and two NPB seasons
+        ('Hiro', 'Sato', 2003, 2006), # NPB namesake in his last MLB season: NPB skipped, MiLB kept
+        ("Pat", "O'Neill", 2002, 2006), # two MiLB levels in one season
+        ('John', 'Doe', 2003, 2006), # different case, and two teams in one table
+        ('Mike', 'Smith Jr.', 2002, 2006), # 'Mike Smith Jr' does not end with 'Smith Jr.'
+        ('Al', 'Nomatch', 2002, 2006),
+    ],
+    2008: [
+        ('Kenji', 'Tanaka', 2006, 2008),
+        ('Carlos', 'Perez', 2005, 2008), # NPB namesake in his return season
+    ],
+}
+
+MILB_SEASONS = {
+    'milb_2003_aa': [('Pat O\'Neill', 'AA', 'Akron Aeros', 'Cleveland Indians'), ('Kenji Tanaka', 'AA', 'Altoona Curve', 'Pittsburgh Pirates')],
+    'milb_2003_aaa': [('Pat O\'Neill', 'AAA', 'Buffalo Bisons', 'Cleveland Indians')],
+    'milb_2004_aaa': [('JD Martinez', 'AAA', 'Durham Bulls', 'Tampa Bay Devil Rays'), ('Juan Dela Cruz', 'AAA', 'Iowa Cubs', 'Chicago Cubs'),
+                      ('JOHN DOE', 'AAA', 'Toledo Mud Hens', 'Detroit Tigers'), ('John Doe', 'AAA', 'Norfolk Tides', 'New York Mets'),
+                      ('Mike Smith Jr', 'AAA', 'Tacoma Rainiers', 'Seattle Mariners'), ('Hiro Sato', 'AAA', 'Salt Lake Stingers', 'Anaheim Angels')],
+    'milb_2005_a': [('J.D. Martinez', 'A', 'Lansing Lugnuts', 'Toronto Blue Jays')],
+    'milb_2006_aa': [('Carlos Perez', 'AA', 'Erie SeaWolves', 'Detroit Tigers')],
+    'milb_2007_aaa': [('Carlos Perez', 'AAA', 'Toledo Mud Hens', 'Detroit Tigers')],
+}
+
+NPB_SEASONS = {
+    'npb_2003': [('Hiro Sato', 'NPB', 'Yomiuri Giants')],
+    'npb_2004': [('Kenji Tanaka', 'NPB', 'Hanshin Tigers')],
+    'npb_2005': [('Kenji Tanaka', 'NPB', 'Hanshin Tigers'), ('Hiro Sato', 'NPB', 'Chunichi Dragons')],
+    'npb_2007': [('Kenji Tanaka', 'NPB', 'Hanshin Tigers'), ('Carlos Perez', 'NPB', 'Orix Buffaloes')],
+    'npb_2008': [('Carlos Perez', 'NPB', 'Orix Buffaloes')],
+}
+
+def baseline_check(engine, schema, columns, detail_format, exclude_namesakes, append):
+    # The per-row LIKE + normalize_name loop of the original check_milb_gaps.py / check_npb_gaps.py, with the
+    # MySQL catalog queries swapped for SQLite's. MiLB replaced gap_details on matched rows; NPB appended.
+    def normalize_name(n):
+        if not n: return ""
+        return n.replace('.', '').replace(' ', '').lower()
+
+    with engine.connect() as conn:
+        result_tables = [r[0] for r in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'players_returning_after_gap_%' ORDER BY name"))]
+        league_tables = [r[0] for r in conn.execute(text(f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' ORDER BY name"))]
+    tables_by_year = {}
+    for t in league_tables:
+        parts = t.split('_')
+        if len(parts) >= 2 and parts[1].isdigit():
+            tables_by_year.setdefault(int(parts[1]), []).append(f"{schema}.`{t}`")
+
+    for table in result_tables:
+        df = pd.read_sql_table(table, engine)
+        for index, row in df.iterrows():
+            first_name, last_name = row['nameFirst'], row['nameLast']
+            normalized_full_name = normalize_name(f"{first_name} {last_name}")
+            safe_last = last_name.replace("'", "''")
+
+            def matches(years, select):
+                found = []
+                for y in years:
+                    for league_table in tables_by_year.get(y, []):
+                        with engine.connect() as conn:
+                            results = conn.execute(text(f"SELECT {select} FROM {league_table} WHERE player_name LIKE '%{safe_last}'")).fetchall()
+                        found.extend((y, res) for res in results if normalize_name(res[0]) == normalized_full_name)
+                return found
+
+            if exclude_namesakes and matches([row['last_seen_year'], row['return_year']], 'player_name'):
+                continue
+            found = matches(range(row['last_seen_year'] + 1, row['return_year']), ', '.join(columns))
+            if not found:
+                continue
+            new_details = "; ".join(detail_format.format(year=y, *res) for y, res in found)
+            current = row['gap_details']
+            if append and pd.notna(current) and current: # read_sql_table gives NaN, not None, for NULL
+                new_details = current + "; " + new_details
+            with engine.begin() as conn:
+                conn.execute(text(f"UPDATE {table} SET gap_details = :details WHERE id = :id"), {'details': new_details, 'id': int(row['id'])})
+
+def baseline_milb(engine):
+    baseline_check(engine, 'milb', gap_engine.MILB.columns, gap_engine.MILB.detail_format, False, append=False)
+
+def baseline_npb(engine):
+    baseline_check(engine, 'npb', gap_engine.NPB.columns, gap_engine.NPB.detail_format, True, append=True)
+
+@pytest.fixture(params=[True, False], ids=['stored-name-key', 'computed-name-key'])
+def fixture_db(request, tmp_path, monkeypatch):
+    # The league and result tables in a throwaway SQLite backend, with or without the ETL's name_key column
+    with_name_key = request.param
+    monkeypatch.setattr(db_config, 'DB_BACKEND', 'sqlite')
+    monkeypatch.setattr(db_config, 'SQLITE_DIR', str(tmp_path))
+    monkeypatch.setattr(gap_engine, 'GAP_WORKERS', 1)
+    monkeypatch.setattr(gap_engine, 'GAP_DETAILS_SOURCE', 'match')
+    for source in gap_engine.LEAGUE_SOURCES:
+        monkeypatch.setattr(source, 'source', 'mysql')
+        monkeypatch.setattr(source, 'match_method', 'exact')
+    db_config.dispose_engines()
+
+    for schema, seasons in (('milb', MILB_SEASONS), ('npb', NPB_SEASONS)):
+        columns = list(gap_engine.MILB.columns if schema == 'milb' else gap_engine.NPB.columns)
+        engine = db_config.get_engine(schema)
+        for table, rows in seasons.items():
+            df = pd.DataFrame(rows, columns=columns)
+            if with_name_key:
+                df['name_key'] = normalize_names(df['player_name'])
+            df.to_sql(table, engine, index=False)
+
+    engine = db_config.get_engine(gap_engine.DB_NAME)
+    for year, players in RETURNING.items():
+        df = pd.DataFrame([(i + 1, first, last, f"p{i}{year}", seen, ret, ret - seen - 1, f"{seen + 1} - {ret - 1}")
+                           for i, (first, last, seen, ret) in enumerate(players)], columns=gap_engine.RESULT_COLUMNS[:-1])
+        df['gap_details'] = pd.Series([None] * len(df), dtype=object)
+        if with_name_key:
+            df['name_key'] = full_name_keys(df['nameFirst'], df['nameLast'])
+        df.to_sql(f'players_returning_after_gap_{year}', engine, index=False)
+
+    yield engine
+    db_config.dispose_engines()
+
+def read_details(engine):
+    return {year: pd.read_sql(f"SELECT id, gap_details FROM players_returning_after_gap_{year} ORDER BY id", engine)
+            for year in RETURNING}
+
+def clear_details(engine):
+    with engine.begin() as conn:
+        for year in RETURNING:
+            conn.execute(text(f"UPDATE players_returning_after_gap_{year} SET gap_details = NULL"))
+
+def assert_same(actual, expected):
+    for year in RETURNING:
+        pd.testing.assert_frame_equal(actual[year], expected[year], obj=f"gap_details for {year}")
+
+def test_checkers_match_the_baseline_loop(fixture_db):
+    baseline_milb(fixture_db)
+    baseline_npb(fixture_db)
+    expected = read_details(fixture_db)
+    # The cases above have to exercise every rule, or the comparison proves little
+    details = pd.concat(expected.values())['gap_details']
+    assert details.notna().sum() == 7
+    assert details.str.contains('Toledo Mud Hens, Detroit Tigers; 2004 - AAA, Norfolk', na=False).sum() == 1 # case, same table
+    assert details.str.contains('Akron Aeros.*Buffalo Bisons', na=False).sum() == 1 # two tables, one season
+    assert details.str.contains('Iowa Cubs|Tacoma', na=False).sum() == 0 # suffix prefilter
+    assert details.str.contains('Yomiuri|Chunichi|Orix', na=False).sum() == 0 # NPB namesakes
+    assert details.str.contains('Salt Lake Stingers', na=False).sum() == 1 # ... which do not exclude MiLB
+    assert details.str.contains('Altoona Curve.*Hanshin Tigers', na=False).sum() == 1 # NPB appended to MiLB
+
+    clear_details(fixture_db)
+    check_milb_gaps.update_gap_details()
+    check_npb_gaps.update_gap_details_npb()
+    assert_same(read_details(fixture_db), expected)
+
+def test_one_pass_engine_matches_the_baseline_loop(fixture_db):
+    baseline_milb(fixture_db)
+    baseline_npb(fixture_db)
+    expected = read_details(fixture_db)
+
+    clear_details(fixture_db)
+    gap_engine.check_gaps()
+    assert_same(read_details(fixture_db), expected)
+
+def test_rerunning_the_checkers_adds_nothing(fixture_db):
+    # The baseline NPB checker appended its entries again on every run; append mode only adds new ones
+    baseline_milb(fixture_db)
+    baseline_npb(fixture_db)
+    expected = read_details(fixture_db)
+
+    clear_details(fixture_db)
+    for _ in range(2):
+        check_milb_gaps.update_gap_details()
+        check_npb_gaps.update_gap_details_npb()
+    gap_engine.check_gaps([gap_engine.NPB], append=True)
+    assert_same(read_details(fixture_db), expected)
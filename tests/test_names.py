@@ -0,0 +1,63 @@
+import math
+import pandas as pd
+import pytest
+from names import normalize_name, normalize_names, full_name_keys, clean_npb_name, clean_npb_names
+
+NAMES = [
+    'Ichiro Suzuki',
+    'J.D. Martinez',
+    'A. J.  Pierzynski',
+    'Shohei Ohtani ',
+    '',
+    None,
+]
+
+HTML_NAMES = [
+    '<a href="https://proeyekyuu.com/player/sugano">Sugano, Tomoyuki</a>',
+    '<a href="/player/1">Yamada Tetsuto</a>',
+    'Murakami, Munetaka',
+    '  Sasaki, Roki  ',
+    'a,b,c',
+    '<a href="/p">Smith, John, Jr.</a>',
+    'Balentien',
+    '<b></b>',
+    '',
+    None,
+    math.nan,
+    42,
+]
+
+@pytest.mark.parametrize('name', NAMES)
+def test_normalize_names_matches_normalize_name(name):
+    assert normalize_names(pd.Series([name], dtype=object)).tolist() == [normalize_name(name)]
+
+@pytest.mark.parametrize('missing', [None, math.nan, pd.NA])
+def test_normalize_names_missing_is_empty(missing):
+    assert normalize_names(pd.Series(['J.D. Martinez', missing], dtype=object)).tolist() == ['jdmartinez', '']
+
+@pytest.mark.parametrize('html_name', HTML_NAMES)
+def test_clean_npb_names_matches_clean_npb_name(html_name):
+    assert clean_npb_names(pd.Series([html_name], dtype=object)).tolist() == [clean_npb_name(html_name)]
+
+def test_clean_npb_names_mixed_column():
+    # Columns with and without commas go through the same split
+    assert clean_npb_names(pd.Series(HTML_NAMES, dtype=object)).tolist() == [clean_npb_name(n) for n in HTML_NAMES]
+
+@pytest.mark.parametrize('first, last, key', [
+    ('J.D.', 'Martinez', 'jdmartinez'),
+    ('Shohei', 'Ohtani', 'shoheiohtani'),
+    (None, 'Smith', 'nonesmith'),
+    (math.nan, 'Smith', 'nansmith'),
+    ('Ichiro', None, 'ichironone'),
+    (None, None, 'nonenone'),
+])
+def test_full_name_keys_match_the_row_at_a_time_key(first, last, key):
+    # Missing names keep the key f"{first} {last}" gave them, so they match nothing they did not match before
+    keys = full_name_keys(pd.Series([first], dtype=object), pd.Series([last], dtype=object))
+    assert keys.tolist() == [key] == [normalize_name(f"{first} {last}")]
+
+def test_full_name_keys_of_a_string_column_with_missing_names():
+    # read_sql gives str columns with NaN for NULL
+    first = pd.Series(['Ichiro', None], dtype='str')
+    last = pd.Series(['Suzuki', 'Smith'], dtype='str')
+    assert full_name_keys(first, last).tolist() == ['ichirosuzuki', 'nansmith']